@@ -0,0 +1,127 @@
+"""
+Checks that every table comes out the same from a pandas DataFrame, a pyarrow Table
+and a polars DataFrame, and times each backend.
+
+Usage: python benchmarks/backends.py [n_rows]
+
+Builds n_rows synthetic line items (default 1M), converts them to each installed
+backend, and runs create_transaction_log and every chart's table on each. Results
+are compared with those of pandas, and an AssertionError names the first that
+differs. Backends that are not installed are skipped.
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
+import lifestream  # noqa: E402
+from synthetic import make_line_items  # noqa: E402
+
+ITEM_COLS = ('InvoiceNo', 'InvoiceDate', 'CustomerID', 'Quantity',
+             'UnitPrice')
+LOG_COLS = ('InvoiceDate', 'CustomerID', 'OrderValue')
+
+# (name, function, arguments after the transaction log, keyword arguments)
+TABLES = [
+    ('sales_table', lifestream.sales_table, LOG_COLS, {}),
+    ('cohort_retention_matrix', lifestream.cohort_retention_matrix,
+     LOG_COLS[:2], {}),
+    ('new_customers_table', lifestream.new_customers_table, LOG_COLS[:2], {}),
+    ('customer_type_revenue_table', lifestream.customer_type_revenue_table,
+     LOG_COLS, {}),
+    ('customer_type_count_table', lifestream.customer_type_count_table,
+     LOG_COLS[:2], {}),
+    ('c3_pivot', lifestream.c3_pivot,
+     ('CustomerID', 'InvoiceDate', 'OrderValue'), {}),
+    ('customer_summary', lifestream.customer_summary, LOG_COLS, {}),
+    ('sales_table by segment', lifestream.sales_table, LOG_COLS, {
+        'segment_col': 'Country'
+    }),
+]
+
+
+def converters():
+    # Each installed backend, as a function from a pandas DataFrame to its table
+    found = [('pandas', lambda df: df)]
+    try:
+        import pyarrow as pa
+        found.append(
+            ('arrow', lambda df: pa.Table.from_pandas(df, preserve_index=False)))
+    except ImportError:
+        pass
+    try:
+        import polars as pl
+        found.append(('polars', pl.from_pandas))
+    except ImportError:
+        pass
+    return found
+
+
+def as_pandas(table):
+    if isinstance(table, pd.DataFrame):
+        return table
+    return table.to_pandas()
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main(n_rows):
+    items = make_line_items(n_rows)
+    items['InvoiceNo'] = items['InvoiceNo'].astype(str)
+    backends = converters()
+    print('line items: {:,}  backends: {}'.format(
+        n_rows, ', '.join(name for name, _ in backends)))
+
+    seconds = {}
+    expected = {}
+    for backend, convert in backends:
+        log, took = timed(lifestream.create_transaction_log, convert(items),
+                          *ITEM_COLS)
+        seconds[('create_transaction_log', backend)] = took
+        log_frame = as_pandas(log)
+        if backend == 'pandas':
+            expected['create_transaction_log'] = log_frame
+        else:
+            pd.testing.assert_frame_equal(
+                log_frame,
+                expected['create_transaction_log'],
+                check_dtype=False,
+                obj='create_transaction_log ({})'.format(backend))
+
+        # Segments are given to the log after aggregation, so every backend's tables
+        # read the same segment of each order
+        log_frame = log_frame.assign(
+            Country=log_frame['CustomerID'].mod(7).astype(str))
+        log = convert(log_frame)
+        for name, func, cols, kwargs in TABLES:
+            result, took = timed(func, log, *cols, **kwargs)
+            seconds[(name, backend)] = took
+            if backend == 'pandas':
+                expected[name] = result
+            else:
+                pd.testing.assert_frame_equal(result,
+                                              expected[name],
+                                              check_dtype=False,
+                                              check_index_type=False,
+                                              rtol=1e-9,
+                                              obj='{} ({})'.format(
+                                                  name, backend))
+
+    print('{:<30}'.format('') + ''.join('{:>10}'.format(name)
+                                       for name, _ in backends))
+    for name in ['create_transaction_log'] + [table[0] for table in TABLES]:
+        print('{:<30}'.format(name) +
+              ''.join('{:>9.2f}s'.format(seconds[(name, backend)])
+                      for backend, _ in backends))
+    print('all backends match pandas')
+
+
+if __name__ == '__main__':
+    main(int(float(sys.argv[1])) if len(sys.argv) > 1 else 1000000)
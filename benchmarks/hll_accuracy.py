@@ -0,0 +1,83 @@
+"""
+Compares approx=True customer counts against exact ones, for accuracy and run time.
+
+Usage: python benchmarks/hll_accuracy.py [n_rows] [error]
+
+For each table, prints the worst relative error of the approximate figures, that
+error in units of the requested standard error, and both run times. Exits non-zero
+if a unique customer count or retention share is off by more than four of its
+standard errors, or if sketches of two customer-partitioned
+shards do not merge into the sketch of the whole log.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
+import lifestream  # noqa: E402
+from peak_memory import make_log  # noqa: E402
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def sales_counts(log, **kwargs):
+    return lifestream.sales_table(log, 'Date', 'CustomerID', 'OrderValue',
+                                  **kwargs)['CustomerID']
+
+
+def cohort_shares(log, **kwargs):
+    # A share is a ratio of two estimates, so its error is up to sqrt(2) larger
+    return lifestream.cohort_retention_matrix(log, 'Date', 'CustomerID',
+                                              **kwargs).stack()
+
+
+def main(n_rows, error):
+    log = make_log(n_rows, n_customers=max(n_rows // 10, 1))
+    print('rows: {:,}  error: {:.3f}'.format(n_rows, error))
+    print('{:<24}{:>10}{:>8}{:>10}{:>10}'.format('table', 'max rel', 'x err',
+                                                 'exact s', 'approx s'))
+
+    ok = True
+    for name, func, bound in [('sales_table', sales_counts, 1),
+                              ('cohort_retention_matrix', cohort_shares,
+                               np.sqrt(2))]:
+        exact, exact_time = timed(func, log)
+        approx, approx_time = timed(func, log, approx=True, error=error)
+        exact, approx = exact.align(approx, join='inner')
+        keep = (exact > 0) & exact.notna()
+        worst = np.abs(approx[keep] / exact[keep] - 1).max()
+        ok &= worst <= 4 * bound * error
+        print('{:<24}{:>10.4f}{:>8.1f}{:>10.2f}{:>10.2f}'.format(
+            name, worst, worst / error, exact_time, approx_time))
+
+    # Shards holding disjoint customers merge into the sketch of the whole log
+    even = log['CustomerID'] % 2 == 0
+    sketches = [
+        lifestream.customer_sketch(part,
+                                   'Date',
+                                   'CustomerID',
+                                   by='cohort',
+                                   error=error) for part in (log[even], log[~even])
+    ]
+    merged = sketches[0].merge(sketches[1])
+    full = lifestream.customer_sketch(log,
+                                      'Date',
+                                      'CustomerID',
+                                      by='cohort',
+                                      error=error)
+    merges = bool((merged.registers == full.registers).all())
+    print('shard merge matches full sketch: {}'.format(merges))
+    return ok and merges
+
+
+if __name__ == '__main__':
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    error = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    sys.exit(0 if main(n_rows, error) else 1)
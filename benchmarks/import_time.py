@@ -0,0 +1,41 @@
+"""
+Measures the cold import time of lifestream, and which plotting backends it loads.
+
+Usage: python benchmarks/import_time.py [src_dir] [repeats]
+
+Each run imports lifestream in a fresh interpreter, so nothing is cached in
+sys.modules. Timings are the median over repeats, in milliseconds.
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+SNIPPET = '''
+import sys, time
+start = time.perf_counter()
+import lifestream
+elapsed = time.perf_counter() - start
+loaded = [m for m in ('pandas', 'matplotlib', 'plotly') if m in sys.modules]
+print(elapsed, ','.join(loaded))
+'''
+
+
+def main(src_dir, repeats):
+    env = dict(os.environ, PYTHONPATH=src_dir)
+    timings = []
+    for _ in range(repeats):
+        output = subprocess.check_output([sys.executable, '-c', SNIPPET],
+                                         env=env,
+                                         universal_newlines=True)
+        elapsed, loaded = output.split()
+        timings.append(float(elapsed) * 1000)
+    print('import lifestream: {:.0f} ms (median of {}), loads {}'.format(
+        statistics.median(timings), repeats, loaded))
+
+
+if __name__ == '__main__':
+    main(
+        sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'),
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10)
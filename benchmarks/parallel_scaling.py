@@ -0,0 +1,60 @@
+"""
+Times the cohort tables with increasing n_jobs, and checks they match the serial results.
+
+Usage: python benchmarks/parallel_scaling.py [n_rows] [max_jobs]
+
+n_jobs doubles from 1 up to max_jobs (default: the number of CPUs). Speedups are
+relative to n_jobs=1 and can only approach n_jobs on a machine with that many
+idle cores.
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
+import lifestream  # noqa: E402
+from peak_memory import make_log  # noqa: E402
+
+CALLS = [
+    ('cohort_retention_matrix', lifestream.cohort_retention_matrix,
+     ('Date', 'CustomerID')),
+    ('customer_type_revenue_table', lifestream.customer_type_revenue_table,
+     ('Date', 'CustomerID', 'OrderValue')),
+    ('customer_type_count_table', lifestream.customer_type_count_table,
+     ('Date', 'CustomerID')),
+    ('c3_pivot', lifestream.c3_pivot, ('CustomerID', 'Date', 'OrderValue')),
+]
+
+
+def main(n_rows, max_jobs):
+    log = make_log(n_rows, n_customers=max(n_rows // 10, 1))
+    jobs = [1]
+    while jobs[-1] * 2 <= max_jobs:
+        jobs.append(jobs[-1] * 2)
+    print('rows: {:,}  cpus: {}'.format(n_rows, os.cpu_count()))
+    print('{:<30}'.format('n_jobs') + ''.join('{:>10}'.format(n) for n in jobs))
+
+    for name, func, cols in CALLS:
+        serial = None
+        seconds = []
+        for n_jobs in jobs:
+            start = time.perf_counter()
+            result = func(log, *cols, n_jobs=n_jobs)
+            seconds.append(time.perf_counter() - start)
+            if serial is None:
+                serial = result
+            else:
+                pd.testing.assert_frame_equal(result, serial, rtol=1e-9)
+        print('{:<30}'.format(name) +
+              ''.join('{:>9.2f}s'.format(s) for s in seconds))
+        print('{:<30}'.format('  speedup') +
+              ''.join('{:>9.1f}x'.format(seconds[0] / s) for s in seconds))
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 10000000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count())
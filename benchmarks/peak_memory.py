@@ -0,0 +1,77 @@
+"""
+Measures the peak memory each lifestream function allocates on top of its input.
+
+Usage: python benchmarks/peak_memory.py [n_rows]
+
+Figures are tracemalloc peaks (NumPy and pandas buffers included) and exclude the
+transaction log itself, whose size is printed first. Figures are never shown.
+"""
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
+import lifestream  # noqa: E402
+import matplotlib.pyplot as plt  # noqa: E402
+from plotly.basedatatypes import BaseFigure  # noqa: E402
+
+BaseFigure.show = lambda self, *args, **kwargs: None
+plt.show = lambda *args, **kwargs: None
+
+
+def make_log(n_rows, n_customers, seed=0):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2018-01-01', 's').astype(np.int64)
+    seconds = rng.integers(0, 3 * 365 * 86400, n_rows)
+    return pd.DataFrame({
+        'OrderID': np.arange(n_rows),
+        'Date': (start + seconds).astype('datetime64[s]').astype(
+            'datetime64[ns]'),
+        'CustomerID': rng.integers(0, n_customers, n_rows),
+        'OrderValue': rng.gamma(2.0, 30.0, n_rows),
+    })
+
+
+def peak(func, *args, **kwargs):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    func(*args, **kwargs)
+    result = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    plt.close('all')
+    return result
+
+
+def main(n_rows):
+    log = make_log(n_rows, n_customers=max(n_rows // 10, 1))
+    mb = 1024.0**2
+    print('rows: {:,}  log: {:,.0f} MB'.format(
+        n_rows, log.memory_usage(deep=True).sum() / mb))
+
+    cols = ('Date', 'CustomerID', 'OrderValue')
+    calls = [
+        ('CustomerIndex', lifestream.CustomerIndex, (log, ) + cols, {}),
+        ('sales_chart', lifestream.sales_chart, (log, ) + cols, {}),
+        ('cohort_retention_chart', lifestream.cohort_retention_chart,
+         (log, 'Date', 'OrderValue', 'CustomerID', '2018-01', '2018-02',
+          '2018-03'), {}),
+        ('new_customers_chart', lifestream.new_customers_chart,
+         (log, 'Date', 'CustomerID'), {}),
+        ('customer_type_revenue_mix', lifestream.customer_type_revenue_mix,
+         (log, ) + cols, {}),
+        ('customer_type_count', lifestream.customer_type_count,
+         (log, 'Date', 'CustomerID'), {}),
+        ('c3_pivot', lifestream.c3_pivot,
+         (log, 'CustomerID', 'Date', 'OrderValue'), {}),
+    ]
+    for name, func, args, kwargs in calls:
+        print('{:<28}{:>10,.0f} MB'.format(name,
+                                           peak(func, *args, **kwargs) / mb))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000000)
@@ -0,0 +1,166 @@
+"""
+Times and memory-profiles lifestream on synthetic line-item logs of growing size.
+
+Usage:
+    python benchmarks/suite.py [--sizes 1e5 1e6 1e7 1e8] [--repeat 3] [--no-memory]
+                               [--output results.json]
+    python benchmarks/suite.py --compare baseline.json results.json
+
+For each size, builds a log with synthetic.make_line_items, then measures
+create_transaction_log on it and every chart's table on the transaction log it
+returns. Seconds are the best of --repeat runs; peak bytes are the tracemalloc peak
+of one more run, on top of the function's input. Results are written as JSON along
+with the versions they were measured with. --compare prints the ratio of two such
+files' figures, so that regressions between versions stand out.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
+import lifestream  # noqa: E402
+from synthetic import make_line_items  # noqa: E402
+
+ITEM_COLS = ('InvoiceNo', 'InvoiceDate', 'CustomerID', 'Quantity',
+             'UnitPrice')
+LOG_COLS = ('InvoiceDate', 'CustomerID', 'OrderValue')
+
+# (name, function, arguments after the transaction log)
+TABLES = [
+    ('CustomerIndex', lifestream.CustomerIndex, LOG_COLS),
+    ('sales_table', lifestream.sales_table, LOG_COLS),
+    ('cohort_retention_matrix', lifestream.cohort_retention_matrix,
+     LOG_COLS[:2]),
+    ('new_customers_table', lifestream.new_customers_table, LOG_COLS[:2]),
+    ('customer_type_revenue_table', lifestream.customer_type_revenue_table,
+     LOG_COLS),
+    ('customer_type_count_table', lifestream.customer_type_count_table,
+     LOG_COLS[:2]),
+    ('c3_pivot', lifestream.c3_pivot,
+     ('CustomerID', 'InvoiceDate', 'OrderValue')),
+]
+
+
+def measure(func, args, repeat, memory):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        seconds.append(time.perf_counter() - start)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return min(seconds), peak
+
+
+def run(sizes, repeat, memory):
+    results = []
+    for size in sizes:
+        items = make_line_items(size)
+        calls = [('create_transaction_log', lifestream.create_transaction_log,
+                  (items, ) + ITEM_COLS)]
+        log = lifestream.create_transaction_log(items, *ITEM_COLS)
+        del items
+        calls += [(name, func, (log, ) + cols) for name, func, cols in TABLES]
+
+        for name, func, args in calls:
+            seconds, peak = measure(func, args, repeat, memory)
+            results.append({
+                'function': name,
+                'rows': size,
+                'orders': len(log),
+                'seconds': seconds,
+                'peak_bytes': peak
+            })
+            print('{:>12,} {:<30}{:>9.3f}s{:>12}'.format(
+                size, name, seconds, '' if peak is None else '{:,.0f} MB'.format(
+                    peak / 1024.0**2)),
+                  flush=True)
+        del calls, log
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=os.path.dirname(__file__),
+                                         stderr=subprocess.DEVNULL)
+        commit = commit.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(baseline_path, results_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(results_path) as f:
+        results = json.load(f)
+    before = {(r['function'], r['rows']): r for r in baseline['results']}
+    print('{:>12} {:<30}{:>10}{:>10}'.format('rows', 'function', 'time',
+                                             'memory'))
+    for after in results['results']:
+        old = before.get((after['function'], after['rows']))
+        if old is None:
+            continue
+        memory = ''
+        if old['peak_bytes'] and after['peak_bytes'] is not None:
+            memory = '{:.2f}x'.format(after['peak_bytes'] / old['peak_bytes'])
+        print('{:>12,} {:<30}{:>9.2f}x{:>10}'.format(
+            after['rows'], after['function'],
+            after['seconds'] / old['seconds'], memory))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes',
+                        nargs='+',
+                        type=float,
+                        default=[1e5, 1e6, 1e7, 1e8],
+                        help='numbers of line items')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare',
+                        nargs=2,
+                        metavar=('BASELINE', 'RESULTS'),
+                        help='compare two result files instead of running')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    results = run([int(size) for size in args.sizes], args.repeat,
+                  not args.no_memory)
+    with open(args.output, 'w') as f:
+        json.dump({
+            'environment': environment(),
+            'results': results
+        },
+                  f,
+                  indent=2)
+    print('wrote {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Reproducible synthetic line-item logs, shaped like the UCI Online Retail export.
+
+Usage: python benchmarks/synthetic.py n_rows path [seed]
+
+Writes n_rows line items to path (.csv or .parquet). From Python, make_line_items
+returns them as a DataFrame, ready for lifestream.create_transaction_log with
+'InvoiceNo', 'InvoiceDate', 'CustomerID', 'Quantity' and 'UnitPrice'.
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+def make_line_items(n_rows,
+                    n_customers=None,
+                    repeat_rate=0.6,
+                    items_per_order=4.0,
+                    mean_gap_days=60.0,
+                    start='2018-01-01',
+                    days=3 * 365,
+                    seed=0):
+    """
+    Creates a log of n_rows line items.
+
+    Parameters
+    ----------
+    n_rows: int
+        the number of line items.
+    n_customers: int, optional
+        the number of customers. By default, enough for the expected number of orders
+        per customer and items per order to give n_rows. More customers join if their
+        orders fall short of n_rows.
+    repeat_rate: float, optional
+        the chance that a customer orders again after each order, so orders per
+        customer are geometric with mean 1 / (1 - repeat_rate).
+    items_per_order: float, optional
+        the mean number of line items in an order; at least one.
+    mean_gap_days: float, optional
+        the mean number of days between a customer's orders. Orders after the end of
+        the date span are dropped.
+    start: string, optional
+        the first day of the date span.
+    days: int, optional
+        the length of the date span. First purchases are spread evenly across it.
+    seed: int, optional
+        the seed of the random generator; the same arguments give the same log.
+    -------
+    :obj: DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    if n_customers is None:
+        per_customer = items_per_order / (1.0 - repeat_rate)
+        n_customers = max(int(n_rows / per_customer), 1)
+
+    # Orders per customer, then each order's customer, time and number of items. If
+    # orders dropped past the end of the span leave the log short, new customers join.
+    span = days * 86400
+    customers, seconds, counts = [], [], []
+    n_items = 0
+    next_customer = 0
+    while n_items < n_rows:
+        orders = rng.geometric(1.0 - repeat_rate, n_customers)
+        customer = np.repeat(np.arange(n_customers), orders)
+        first = rng.integers(0, span, n_customers)
+        gaps = rng.exponential(mean_gap_days * 86400, len(customer))
+        # Each customer's first order has no gap before it
+        starts = np.cumsum(orders) - orders
+        gaps[starts] = 0
+        offsets = np.cumsum(gaps)
+        offsets -= np.repeat(offsets[starts], orders)
+        when = first[customer] + offsets.astype(np.int64)
+        keep = when < span
+        items = 1 + rng.poisson(items_per_order - 1.0, int(keep.sum()))
+        customers.append(customer[keep] + next_customer)
+        seconds.append(when[keep])
+        counts.append(items)
+        n_items += int(items.sum())
+        next_customer += n_customers
+        n_customers = max(int(n_customers * (n_rows - n_items) / n_rows), 1)
+    customer = np.concatenate(customers)
+    second = np.concatenate(seconds)
+    items = np.concatenate(counts)
+
+    # Number orders in time order, as an export would
+    order = np.argsort(second, kind='stable')
+    customer = customer[order]
+    second = second[order]
+    rows = np.repeat(np.arange(len(customer)), items[order])[:n_rows]
+
+    return pd.DataFrame({
+        'InvoiceNo':
+        rows + 500000,
+        'InvoiceDate':
+        (np.datetime64(start, 's') + second[rows]).astype('datetime64[ns]'),
+        'CustomerID':
+        customer[rows] + 10000,
+        'Quantity':
+        rng.integers(1, 13, len(rows)).astype(np.int32),
+        'UnitPrice':
+        np.round(rng.gamma(2.0, 2.5, len(rows)), 2),
+    })
+
+
+if __name__ == '__main__':
+    items = make_line_items(int(float(sys.argv[1])),
+                            seed=int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+    if sys.argv[2].endswith('.parquet'):
+        items.to_parquet(sys.argv[2], index=False)
+    else:
+        items.to_csv(sys.argv[2], index=False)
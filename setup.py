@@ -9,6 +9,7 @@ setup(
     description = 'The fastest way to make sense of a transaction log.',
     py_modules = ["lifestream"],
     package_dir = {'': 'src'},
+    python_requires = '>=3.9',
     install_requires = [
         'pandas',
         'matplotlib',
@@ -16,9 +17,17 @@ setup(
         'datetime',
         'plotly'
     ],
+    entry_points = {
+        'console_scripts': ['lifestream=lifestream:main'],
+    },
+    extras_require = {
+        'parquet': ['pyarrow'],
+        'arrow': ['pyarrow'],
+        'polars': ['polars', 'pyarrow'],
+    },
     classifiers = [
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.9",
         "Intended Audience :: Information Technology",
         "Intended Audience :: Financial and Insurance Industry",
         "License :: OSI Approved :: MIT License",
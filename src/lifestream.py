@@ -1,14 +1,779 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 import numpy as np
-from matplotlib.pyplot import figure
-from datetime import datetime
-import matplotlib.ticker as mtick
-import plotly.express as px
-import matplotlib.pyplot as plt
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import collections
+import contextlib
+import functools
+import hashlib
+import inspect
+import io
+import json
+import logging
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+# matplotlib and plotly are imported inside the chart functions, so that importing
+# lifestream (or only computing tables) never loads a plotting backend.
+
+
+# Profiling. The public functions time their stages (parse, bucket, first-purchase,
+# aggregate, pivot and render) through _stage. While no profiler is active, _stage
+# hands back a shared no-op, so an unprofiled call pays one truth test per stage.
+_profilers = []
+_active_stages = []
+_log = logging.getLogger('lifestream')
+
+
+class _NoStage(object):
+    rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class _Stage(object):
+
+    def __init__(self, name, rows_in, memory):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.memory = memory
+        self.peak = 0
+
+    def __enter__(self):
+        if self.memory:
+            # Keep the enclosing stage's peak before resetting it for this one
+            if _active_stages:
+                outer = _active_stages[-1]
+                outer.peak = max(outer.peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self.base = tracemalloc.get_traced_memory()[0]
+        _active_stages.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        _active_stages.pop()
+        peak = None
+        if self.memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            if _active_stages:
+                outer = _active_stages[-1]
+                outer.peak = max(outer.peak, self.peak)
+            peak = max(self.peak - self.base, 0)
+        record = {
+            'function': _public_caller(),
+            'stage': self.name,
+            'seconds': seconds,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'peak_bytes': peak
+        }
+        for callback, _ in list(_profilers):
+            callback(record)
+        return False
+
+
+def _stage(name, rows_in=None):
+    if not _profilers:
+        return _NO_STAGE
+    memory = any(memory for _, memory in _profilers)
+    return _Stage(name, rows_in, memory and tracemalloc.is_tracing())
+
+
+def _public_caller():
+    # The outermost public lifestream function or class on the call stack
+    name = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_globals is globals():
+            code = frame.f_code.co_name
+            if code == '__init__' and 'self' in frame.f_locals:
+                code = type(frame.f_locals['self']).__name__
+            if not code.startswith('_') and code != '<module>':
+                name = code
+        frame = frame.f_back
+    return name
+
+
+@contextlib.contextmanager
+def profile(callback=None, memory=False):
+    """
+    Records the wall time, rows in and out and, optionally, peak memory of every stage
+    of the lifestream functions called within the block.
+
+    Stages are 'parse', 'bucket', 'first-purchase', 'aggregate', 'pivot' and 'render'.
+    Each is recorded as a dict with the 'function' called, the 'stage', its 'seconds',
+    'rows_in', 'rows_out' and 'peak_bytes' allocated on top of what was allocated when
+    the stage began (None unless memory is True). A stage that runs inside another,
+    such as a lazy sort within an aggregation, is recorded on its own and also counts
+    towards the enclosing stage.
+
+    Setting the LIFESTREAM_PROFILE environment variable profiles every call, logging
+    each record as JSON to the 'lifestream' logger at INFO level;
+    LIFESTREAM_PROFILE=memory also records peak memory.
+
+    Parameters
+    ----------
+    callback: callable, optional
+        called with each record as soon as its stage ends.
+    memory: boolean, optional
+        record peak memory with tracemalloc, which slows allocations down.
+    -------
+    :obj: list
+        the records of the block, in the order their stages ended.
+
+    Examples
+    --------
+    >>> with lifestream.profile() as records:
+    ...     lifestream.cohort_retention_matrix(transaction_log, 'date', 'user_id')
+    >>> pd.DataFrame(records)
+    """
+    records = []
+
+    def collect(record):
+        records.append(record)
+        if callback is not None:
+            callback(record)
+
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    entry = (collect, memory)
+    _profilers.append(entry)
+    try:
+        yield records
+    finally:
+        _profilers.remove(entry)
+        if started:
+            tracemalloc.stop()
+
+
+def _log_record(record):
+    _log.info(json.dumps(record))
+
+
+if os.environ.get('LIFESTREAM_PROFILE', '0') not in ('', '0'):
+    if os.environ['LIFESTREAM_PROFILE'] == 'memory':
+        tracemalloc.start()
+    _profilers.append((_log_record, True))
+
+
+# Result cache. The table functions are wrapped by _cached, which, once enable_cache has
+# installed a ResultCache, looks their result up by a fingerprint of the columns they
+# read and their other arguments before computing it.
+_result_cache = None
+
+
+@functools.lru_cache(maxsize=None)
+def _source_digest():
+    # SHA-1 of this module's source, which salts the keys of stored results so that
+    # those made by another version of the code are never reused
+    with open(__file__, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class ResultCache(object):
+    """
+    A least recently used cache of table results, keyed by the content of the columns
+    they were computed from and the other arguments of the call.
+
+    Results are held in memory up to max_bytes, dropping the least recently used ones
+    first. With a path, every result is also written there as an .npz file, so that it
+    outlives its eviction from memory and the Python process; the files are keyed by
+    the lifestream source as well, so upgrading lifestream never reads stale results.
+
+    Parameters
+    ----------
+    max_bytes: int, optional
+        the memory budget of the cached results, in bytes.
+    path: string, optional
+        a directory to also keep results in; created if missing.
+    """
+
+    def __init__(self, max_bytes=256 * 1024**2, path=None):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._salt = _source_digest()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Returns the number of hits (of which disk_hits were read from path), misses and
+        evictions, and the number of entries and bytes held in memory, as a dict.
+        """
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self),
+            'bytes': self.nbytes
+        }
+
+    def key(self, name, columns, arguments):
+        """
+        Returns the key of a call to the function name on the given columns (Series or
+        arrays) with the given other arguments.
+        """
+        digest = hashlib.sha1()
+        digest.update(repr((self._salt, name, arguments)).encode())
+        for column in columns:
+            digest.update(_fingerprint(column))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns a copy of the result cached under key, or None if there is none.
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0].copy()
+        if self.path is not None and os.path.exists(self._file(key)):
+            result = _load_frame(self._file(key))
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, result)
+            return result.copy()
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """
+        Caches a copy of the DataFrame result under key.
+        """
+        self._remember(key, result.copy())
+        if self.path is not None:
+            _save_frame(self._file(key), result)
+
+    def clear(self):
+        """
+        Empties the memory tier and resets the stats. Files under path are kept.
+        """
+        self._entries.clear()
+        self.nbytes = self.hits = self.disk_hits = self.misses = self.evictions = 0
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.npz')
+
+    def _remember(self, key, result):
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+        nbytes = int(result.memory_usage(index=True, deep=True).sum())
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = (result, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, (_, dropped) = self._entries.popitem(last=False)
+            self.nbytes -= dropped
+            self.evictions += 1
+
+
+def enable_cache(max_bytes=256 * 1024**2, path=None):
+    """
+    Caches the results of the table functions (and so of the charts drawn from them)
+    called on a transaction log DataFrame. Calling one again on columns with the same
+    content and the same arguments returns the cached result, after reading the columns
+    once to fingerprint them. n_jobs is not part of the key, as it does not change
+    results.
+
+    Parameters
+    ----------
+    max_bytes: int, optional
+        the memory budget of the cached results, in bytes.
+    path: string, optional
+        a directory to also keep results in, across sessions.
+    -------
+    :obj: ResultCache
+        the cache, whose stats() report its hits and misses.
+    """
+    global _result_cache
+    _result_cache = ResultCache(max_bytes, path)
+    return _result_cache
+
+
+def disable_cache():
+    """
+    Stops caching results, and drops the cache held in memory.
+    """
+    global _result_cache
+    _result_cache = None
+
+
+def _fingerprint(column):
+    # A digest of a column's dtype, length and content. Columns of Python objects (such
+    # as strings) are hashed element-wise first; others are hashed as raw bytes.
+    values = np.asarray(column)
+    if values.dtype == object:
+        values = pd.util.hash_array(values)
+    values = np.ascontiguousarray(values)
+    digest = hashlib.sha1('{}:{}'.format(values.dtype, len(values)).encode())
+    digest.update(values.view(np.uint8))
+    return digest.digest()
+
+
+def _cached(*column_args):
+    # Decorates a table function to use the installed ResultCache. column_args name the
+    # arguments holding the columns it reads from transaction_log; those left as None
+    # are skipped.
+    def decorate(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def _memoized(*args, **kwargs):
+            cache = _result_cache
+            bound = signature.bind(*args, **kwargs)
+            transaction_log = bound.arguments['transaction_log']
+            if cache is None or isinstance(transaction_log,
+                                           (CustomerIndex, CohortState)):
+                return func(*args, **kwargs)
+            bound.apply_defaults()
+            # List-likes (such as customers) are fingerprinted, as their repr is cut short
+            arguments = tuple(
+                (name, value if np.ndim(value) == 0 else _fingerprint(value))
+                for name, value in bound.arguments.items()
+                if name not in ('transaction_log', 'n_jobs'))
+            backend = _backend(transaction_log)
+            columns = [
+                backend.column(bound.arguments[name]) for name in column_args
+                if bound.arguments[name] is not None
+            ]
+            key = cache.key(func.__name__, columns, arguments)
+            result = cache.get(key)
+            if result is None:
+                result = func(*args, **kwargs)
+                cache.put(key, result)
+            return result
+
+        return _memoized
+
+    return decorate
+
+
+def _save_frame(path, df):
+    # Writes a DataFrame of numeric columns to an .npz file, through a temporary file so
+    # that a concurrent reader never sees a partial one. Each level of the index is
+    # saved as its own array, so segmented tables keep their (segment, period) index.
+    levels = []
+    for i in range(df.index.nlevels):
+        level = df.index.get_level_values(i).to_numpy()
+        if level.dtype == object:
+            level = level.astype(str)
+        levels.append(level)
+    meta = {
+        'columns': df.columns.tolist(),
+        'columns_name': df.columns.name,
+        'index_names': list(df.index.names)
+    }
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary, 'wb') as f:
+        np.savez(f,
+                 meta=np.array(json.dumps(meta)),
+                 **{
+                     'index{}'.format(i): level
+                     for i, level in enumerate(levels)
+                 },
+                 **{
+                     'c{}'.format(i): df.iloc[:, i].to_numpy()
+                     for i in range(df.shape[1])
+                 })
+    os.replace(temporary, path)
+
+
+def _load_frame(path):
+    with np.load(path, allow_pickle=False) as saved:
+        meta = json.loads(str(saved['meta']))
+        if 'index_names' in meta:
+            names = meta['index_names']
+            levels = [saved['index{}'.format(i)] for i in range(len(names))]
+            if len(levels) == 1:
+                index = pd.Index(levels[0], name=names[0])
+            else:
+                index = pd.MultiIndex.from_arrays(levels, names=names)
+        else:
+            # Written before indexes were saved level by level
+            index = pd.Index(saved['index'], name=meta['index_name'])
+        df = pd.DataFrame(
+            {i: saved['c{}'.format(i)]
+             for i in range(len(meta['columns']))},
+            index=index)
+    df.columns = pd.Index(meta['columns'], name=meta['columns_name'])
+    return df
+
+
+# Backends. Transaction logs may be pandas DataFrames, pyarrow Tables or polars
+# DataFrames. A backend reads the few columns a function needs into the NumPy arrays
+# the aggregation core works on, and builds tables of its own kind from such arrays.
+# Line items are summed into orders in the table's own engine, which for Arrow and
+# polars runs on all cores; the cohort tables always run on the NumPy core.
+# pyarrow and polars are never imported unless a table of theirs is passed.
+class _PandasBackend(object):
+    name = 'pandas'
+
+    def __init__(self, table):
+        self.table = table
+
+    def column(self, name):
+        # The column in the table's own type, for hashing, comparing and copying
+        return self.table[name]
+
+    def factorize(self, name, sort=False):
+        # (codes, uniques) as pd.factorize: codes in order of first appearance (or of
+        # sorted uniques), -1 for missing values
+        return pd.factorize(self.table[name], sort=sort)
+
+    def datetimes(self, name):
+        return pd.to_datetime(self.table[name]).to_numpy(dtype='datetime64[ns]')
+
+    def numbers(self, name, dtype=None):
+        return self.table[name].to_numpy(dtype=dtype)
+
+    def missing(self, name):
+        return self.table[name].isna().to_numpy()
+
+    def differs(self, name, rows, other_rows):
+        # Whether the column's value at each of rows differs from that at other_rows.
+        # Compared in the column's own type, so strings are not boxed into objects.
+        values = self.table[name].array
+        return np.asarray(values[rows] != values[other_rows], dtype=bool)
+
+    def take(self, names, rows):
+        # The given rows of the named columns, as a backend of the same kind
+        return type(self)(self.table[names].iloc[rows].reset_index(drop=True))
+
+    def build(self, columns):
+        # A table of this kind from a dict of columns
+        return pd.DataFrame(columns)
+
+    def orders(self, orderid_col, datetime_col, customerid_col, quantity_col,
+               unitprice_col, returns, cancel_prefix):
+        # create_transaction_log of the table
+        return _order_log(self, orderid_col, datetime_col, customerid_col,
+                          quantity_col, unitprice_col, returns, cancel_prefix)
+
+
+class _ArrowBackend(_PandasBackend):
+    # pyarrow Tables. Columns are converted one at a time, without a pandas copy of
+    # the whole table.
+    name = 'arrow'
+
+    def _arrow(self, name):
+        return self.table.column(name)
+
+    def column(self, name):
+        return self._arrow(name)
+
+    def factorize(self, name, sort=False):
+        import pyarrow.compute as pc
+
+        encoded = pc.dictionary_encode(self._arrow(name).combine_chunks())
+        codes = encoded.indices.fill_null(-1).to_numpy().astype(np.intp)
+        uniques = pd.Index(encoded.dictionary.to_pandas())
+        if sort and len(uniques):
+            order = uniques.argsort()
+            rank = np.empty(len(order), dtype=np.intp)
+            rank[order] = np.arange(len(order))
+            codes = np.where(codes < 0, -1, rank[codes])
+            uniques = uniques[order]
+        return codes, uniques
+
+    def datetimes(self, name):
+        import pyarrow as pa
+
+        column = self._arrow(name)
+        if not (pa.types.is_timestamp(column.type)
+                or pa.types.is_date(column.type)):
+            return pd.to_datetime(column.to_pandas()).to_numpy(
+                dtype='datetime64[ns]')
+        return column.cast(pa.timestamp('ns')).to_numpy().astype(
+            'datetime64[ns]')
+
+    def numbers(self, name, dtype=None):
+        return np.asarray(self._arrow(name).to_numpy(), dtype=dtype)
+
+    def missing(self, name):
+        return self._arrow(name).is_null(nan_is_null=True).to_numpy()
+
+    def differs(self, name, rows, other_rows):
+        import pyarrow.compute as pc
+
+        column = self._arrow(name)
+        values = column if isinstance(rows, slice) else column.take(rows)
+        return pc.not_equal(values, column.take(other_rows)).to_numpy()
+
+    def take(self, names, rows):
+        return type(self)(self.table.select(names).take(rows))
+
+    def build(self, columns):
+        import pyarrow as pa
+
+        return pa.table(columns)
+
+    def orders(self, orderid_col, datetime_col, customerid_col, quantity_col,
+               unitprice_col, returns, cancel_prefix):
+        # Arrow's multithreaded hash aggregation, grouped by order id alone. An
+        # order's date and customer are checked by comparing their min and max, which
+        # unlike taking the first value keeps the aggregation multithreaded.
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        table = self.table
+        with _stage('parse', table.num_rows) as stage:
+            keys = [orderid_col, datetime_col, customerid_col]
+            missing = [pc.is_null(table.column(key), nan_is_null=True)
+                       for key in keys]
+            if any(pc.any(mask).as_py() for mask in missing):
+                table = table.filter(
+                    pc.invert(functools.reduce(pc.or_, missing)))
+            quantities = table.column(quantity_col).cast(pa.float64())
+            values = pc.multiply(quantities,
+                                 table.column(unitprice_col).cast(pa.float64()))
+            values = pc.if_else(pc.is_nan(values), 0.0, values).fill_null(0.0)
+            lines = table.select(keys).append_column('line_value', values)
+            if returns != 'keep':
+                returned = pc.less(quantities, 0.0).fill_null(False)
+                if cancel_prefix is not None:
+                    returned = pc.or_(
+                        returned,
+                        pc.starts_with(
+                            table.column(orderid_col).cast(pa.string()),
+                            cancel_prefix))
+                lines = lines.append_column(
+                    'purchase_value', pc.if_else(returned, 0.0, values))
+                lines = lines.append_column(
+                    'purchase_lines', pc.invert(returned).cast(pa.int64()))
+            stage.rows_out = lines.num_rows
+
+        with _stage('aggregate', lines.num_rows) as stage:
+            aggregations = [(datetime_col, 'min'), (datetime_col, 'max'),
+                            (customerid_col, 'min'), (customerid_col, 'max'),
+                            ('line_value', 'sum')]
+            if returns != 'keep':
+                aggregations += [('purchase_value', 'sum'),
+                                 ('purchase_lines', 'sum')]
+            grouped = lines.group_by(orderid_col).aggregate(aggregations)
+            grouped = grouped.sort_by(orderid_col)
+            for name in (datetime_col, customerid_col):
+                conflicts = pc.not_equal(grouped.column(name + '_min'),
+                                         grouped.column(name + '_max'))
+                if pc.any(conflicts).as_py():
+                    raise ValueError(
+                        "order {!r} has more than one value of '{}'".format(
+                            grouped.column(orderid_col)[pc.index(
+                                conflicts, True).as_py()].as_py(), name))
+            if returns == 'drop':
+                grouped = grouped.filter(
+                    pc.greater(grouped.column('purchase_lines_sum'), 0))
+
+            columns = {
+                orderid_col:
+                grouped.column(orderid_col),
+                datetime_col:
+                pa.array(type(self)(grouped).datetimes(datetime_col + '_min'),
+                         type=pa.timestamp('ns')),
+                customerid_col:
+                grouped.column(customerid_col + '_min'),
+                'OrderValue':
+                grouped.column('line_value_sum' if returns ==
+                               'keep' else 'purchase_value_sum')
+            }
+            if returns == 'split':
+                columns['ReturnValue'] = pc.subtract(
+                    grouped.column('line_value_sum'),
+                    grouped.column('purchase_value_sum'))
+            stage.rows_out = grouped.num_rows
+        return pa.table(columns)
+
+
+class _PolarsBackend(_ArrowBackend):
+    # polars DataFrames, whose columns are read through their Arrow buffers
+    name = 'polars'
+
+    def _arrow(self, name):
+        import pyarrow as pa
+
+        return pa.chunked_array([self.table.get_column(name).to_arrow()])
+
+    def column(self, name):
+        return self.table.get_column(name)
+
+    def take(self, names, rows):
+        return type(self)(self.table.select(names)[rows])
+
+    def build(self, columns):
+        import polars as pl
+
+        return pl.DataFrame(columns)
+
+    def orders(self, orderid_col, datetime_col, customerid_col, quantity_col,
+               unitprice_col, returns, cancel_prefix):
+        # One lazy query grouped by order id alone, which polars plans and runs on
+        # all cores, collected once
+        import polars as pl
+
+        keys = [orderid_col, datetime_col, customerid_col]
+        quantities = pl.col(quantity_col).cast(pl.Float64)
+        values = (quantities * pl.col(unitprice_col).cast(pl.Float64)).fill_nan(
+            0.0).fill_null(0.0)
+        returned = (quantities < 0).fill_null(False)
+        if cancel_prefix is not None:
+            returned = returned | pl.col(orderid_col).cast(
+                pl.String).str.starts_with(cancel_prefix)
+        purchases = pl.when(returned).then(0.0).otherwise(values)
+
+        with _stage('aggregate', self.table.height) as stage:
+            grouped = self.table.lazy().drop_nulls(keys).group_by(
+                orderid_col).agg(
+                    pl.col(datetime_col).first(),
+                    pl.col(customerid_col).first(),
+                    pl.col(datetime_col).n_unique().alias('n_dates'),
+                    pl.col(customerid_col).n_unique().alias('n_customers'),
+                    values.sum().alias('line_value'),
+                    purchases.sum().alias('purchase_value'),
+                    (~returned).sum().alias('purchase_lines'),
+                ).sort(orderid_col).collect()
+            for name, count in ((datetime_col, 'n_dates'),
+                                (customerid_col, 'n_customers')):
+                conflicts = grouped.filter(pl.col(count) > 1)
+                if conflicts.height:
+                    raise ValueError(
+                        "order {!r} has more than one value of '{}'".format(
+                            conflicts.get_column(orderid_col)[0], name))
+            if returns == 'drop':
+                grouped = grouped.filter(pl.col('purchase_lines') > 0)
+
+            if grouped.schema[datetime_col] == pl.String:
+                date = pl.col(datetime_col).str.to_datetime(time_unit='ns')
+            else:
+                date = pl.col(datetime_col).cast(pl.Datetime('ns'))
+            columns = [
+                pl.col(orderid_col), date,
+                pl.col(customerid_col),
+                pl.col('line_value' if returns ==
+                       'keep' else 'purchase_value').alias('OrderValue')
+            ]
+            if returns == 'split':
+                columns.append((pl.col('line_value') -
+                                pl.col('purchase_value')).alias('ReturnValue'))
+            transaction_log = grouped.select(columns)
+            stage.rows_out = transaction_log.height
+        return transaction_log
+
+
+def _backend(table):
+    # The backend reading table. Tables that are neither a pyarrow Table nor a polars
+    # DataFrame are read as pandas DataFrames.
+    kind = type(table)
+    library = kind.__module__.split('.')[0]
+    if library == 'pyarrow' and kind.__name__ == 'Table':
+        return _ArrowBackend(table)
+    if library == 'polars' and kind.__name__ == 'DataFrame':
+        return _PolarsBackend(table)
+    return _PandasBackend(table)
+
+
+RETURNS = ('keep', 'drop', 'split')
+
+
+def _order_log(backend, orderid_col, datetime_col, customerid_col, quantity_col,
+               unitprice_col, returns, cancel_prefix):
+    # create_transaction_log's kernel. Order ids are factorized once; an order's date
+    # and customer are attributes read off one of its lines and checked against the
+    # others, not grouping keys, so only the order ids are ever hashed. Totals are
+    # then weighted bincounts over the order codes.
+    with _stage('parse', len(backend.table)) as stage:
+        codes, order_ids = backend.factorize(orderid_col, sort=True)
+        quantities = backend.numbers(quantity_col, dtype=np.float64)
+        values = quantities * backend.numbers(unitprice_col, dtype=np.float64)
+        np.copyto(values, 0.0, where=np.isnan(values))
+
+        # Line items missing a key are left out, as they would be by a groupby
+        valid = codes >= 0
+        for name in (datetime_col, customerid_col):
+            valid &= ~backend.missing(name)
+        if valid.all():
+            rows = slice(None)
+            line_rows = np.arange(len(codes))
+        else:
+            rows = line_rows = np.flatnonzero(valid)
+            codes = codes[rows]
+            quantities = quantities[rows]
+            values = values[rows]
+        stage.rows_out = len(order_ids)
+
+    with _stage('aggregate', len(codes)) as stage:
+        # The row of one line of each order, and of each line's order
+        n_orders = len(order_ids)
+        order_rows = np.zeros(n_orders, dtype=np.intp)
+        order_rows[codes] = line_rows
+        del line_rows
+        for name in (datetime_col, customerid_col):
+            conflicts = backend.differs(name, rows, order_rows[codes])
+            if conflicts.any():
+                raise ValueError(
+                    "order {!r} has more than one value of '{}'".format(
+                        order_ids[codes[conflicts.argmax()]], name))
+        del conflicts
+
+        # Returned lines are those with a negative quantity, plus every line of a
+        # cancelled order. Cancellations are found among the distinct order ids, so
+        # they cost no pass over the line items.
+        lines = np.bincount(codes, minlength=n_orders)
+        if returns == 'keep':
+            totals = np.bincount(codes, weights=values, minlength=n_orders)
+            keep = lines > 0
+        else:
+            returned = quantities < 0
+            if cancel_prefix is not None:
+                cancelled = order_ids.astype(str).str.startswith(cancel_prefix)
+                returned |= np.asarray(cancelled)[codes]
+            totals = np.bincount(codes,
+                                 weights=np.where(returned, 0.0, values),
+                                 minlength=n_orders)
+            if returns == 'drop':
+                keep = np.bincount(codes, weights=~returned,
+                                   minlength=n_orders) > 0
+            else:
+                returned_totals = np.bincount(
+                    codes, weights=values, minlength=n_orders) - totals
+                keep = lines > 0
+        kept = np.flatnonzero(keep)
+
+        # Each kept order's id, date and customer are copied off one of its lines
+        orders = backend.take([orderid_col, datetime_col, customerid_col],
+                              order_rows[kept])
+        columns = {
+            orderid_col: orders.column(orderid_col),
+            datetime_col: orders.datetimes(datetime_col),
+            customerid_col: orders.column(customerid_col),
+            'OrderValue': totals[kept]
+        }
+        if returns == 'split':
+            columns['ReturnValue'] = returned_totals[kept]
+        transaction_log = backend.build(columns)
+        stage.rows_out = len(kept)
+    return transaction_log
 
 
 def create_transaction_log(
@@ -18,6 +783,9 @@ def create_transaction_log(
         customerid_col,
         quantity_col,
         unitprice_col,
+        store=None,
+        returns='keep',
+        cancel_prefix='C',
 ):
     """
     Creates a transaction log that can be used in subsequent methods.
@@ -28,12 +796,19 @@ def create_transaction_log(
     It accepts transaction data, and returns a DataFrame of a standard transaction
     log.
 
-    Future state shall deal with other kinds of anomalies/cases.
+    Line items are grouped by order_id alone: an order's datetime and customer_id are
+    the same on all of its lines, and a ValueError names the first order where they
+    are not. Line items missing any of the three are left out.
+
+    Returns and cancellations, as in the UC Irvine data, are lines with a negative
+    quantity and orders whose id starts with cancel_prefix. By default they are
+    summed in with the purchases; see returns.
     
     Parameters
     ----------
     df: :obj: DataFrame
-        a Pandas DataFrame that contains your transactional data.
+        a Pandas DataFrame that contains your transactional data, or a pyarrow Table or
+        polars DataFrame of it.
     orderid_col: string
         the column in df DataFrame that denotes the unique order_id.
     datetime_col:  string
@@ -44,22 +819,1368 @@ def create_transaction_log(
         the column in df DataFrame that denotes the quantity of items purchased in an order.
     unitprice_col: string
         the column in df DataFrame that denotes the unit price of items purchased in an order.
+    store: string, optional
+        a directory to also save the transaction log to, as a TransactionLog that later
+        jobs can open with TransactionLog.load instead of rebuilding it.
+    returns: string, optional
+        'keep' to sum returned lines into their orders, 'drop' to leave them out, along
+        with the orders left without any purchase, or 'split' to sum them into a
+        separate 'ReturnValue' column instead of 'OrderValue'.
+    cancel_prefix: string, optional
+        the prefix of the ids of cancelled orders, all of whose lines are returns. None
+        if cancellations only show as negative quantities.
     Returns
     -------
     :obj: DataFrame
         A DataFrame with an order_id column, date column, customer_id column and a 'OrderValue' column, 
-        which represents the total price of one transaction.
+        which represents the total price of one transaction. It is a table of the same
+        kind as df, sorted by order_id. With returns='split', 'ReturnValue' holds the
+        value of the order's returned lines, as a negative amount.
     """
-
-    df['OrderValue'] = df[quantity_col] * df[unitprice_col]
-    grouped = df.groupby([orderid_col, datetime_col, customerid_col])
-    transaction_log = grouped.agg({'OrderValue': np.sum})
-    transaction_log.reset_index(inplace=True)
-    transaction_log[datetime_col] = transaction_log[datetime_col].astype(
-        'datetime64[ns]')
+    if returns not in RETURNS:
+        raise ValueError('returns must be one of {}, not {!r}'.format(
+            RETURNS, returns))
+    transaction_log = _backend(df).orders(orderid_col, datetime_col,
+                                          customerid_col, quantity_col,
+                                          unitprice_col, returns, cancel_prefix)
+    if store is not None:
+        TransactionLog(transaction_log, datetime_col, customerid_col,
+                       'OrderValue').save(store)
     return transaction_log
 
 
+def read_transaction_log(path,
+                         orderid_col,
+                         datetime_col,
+                         customerid_col,
+                         quantity_col,
+                         unitprice_col,
+                         chunksize=1000000,
+                         file_format=None,
+                         orderid_dtype=None,
+                         customerid_dtype=None,
+                         value_dtype='float64',
+                         returns='keep',
+                         cancel_prefix='C',
+                         **read_kwargs):
+    """
+    Creates a transaction log straight from a CSV or Parquet file of line items, reading it in chunks.
+
+    This is create_transaction_log for exports that don't fit in memory. Each chunk is
+    reduced to partial order totals as soon as it is read, and partials of orders that
+    straddle a chunk boundary are summed together, so memory is bounded by the number
+    of orders rather than the number of line items. The result is the same transaction
+    log create_transaction_log would return for the whole file: line items are grouped
+    by order_id alone, and a ValueError names the first order whose lines, in the same
+    chunk or not, disagree on its datetime or customer_id.
+
+    Parameters
+    ----------
+    path: string
+        the path of a CSV or Parquet file of line items.
+    orderid_col: string
+        the column in the file that denotes the unique order_id.
+    datetime_col:  string
+        the column in the file that denotes the datetime the purchase was made.
+    customerid_col: string
+        the column in the file that denotes the unique customer_id.
+    quantity_col: string
+        the column in the file that denotes the quantity of items purchased in an order.
+    unitprice_col: string
+        the column in the file that denotes the unit price of items purchased in an order.
+    chunksize: int, optional
+        the number of line items to read at a time.
+    file_format: string, optional
+        'csv' or 'parquet'. Inferred from the file extension by default.
+    orderid_dtype: string, optional
+        dtype for the order ids, e.g. 'int64' or 'category'. CSV order ids are read as
+        strings by default, since exports such as UCI's mix numbers and 'C'-prefixed ids.
+    customerid_dtype: string, optional
+        dtype for the customer ids, e.g. 'int32' or 'category'.
+    value_dtype: string, optional
+        dtype of the 'OrderValue' column. Sums are always accumulated in float64, so
+        'float32' only narrows the returned column.
+    returns: string, optional
+        how to count returned lines, as in create_transaction_log.
+    cancel_prefix: string, optional
+        the prefix of the ids of cancelled orders, as in create_transaction_log.
+    **read_kwargs:
+        passed on to pandas.read_csv, e.g. sep or encoding. Ignored for Parquet.
+    Returns
+    -------
+    :obj: DataFrame
+        A DataFrame with an order_id column, date column, customer_id column and a 'OrderValue' column,
+        which represents the total price of one transaction, sorted by order_id. With
+        returns='split', 'ReturnValue' holds the value of the order's returned lines.
+    """
+    if returns not in RETURNS:
+        raise ValueError('returns must be one of {}, not {!r}'.format(
+            RETURNS, returns))
+    columns = [
+        orderid_col, datetime_col, customerid_col, quantity_col, unitprice_col
+    ]
+    totals = ['OrderValue'] + (['ReturnValue'] if returns == 'split' else [])
+    aggregations = {datetime_col: 'first', customerid_col: 'first'}
+    aggregations.update((total, 'sum') for total in totals)
+    if file_format is None:
+        file_format = 'parquet' if str(path).lower().endswith(
+            ('.parquet', '.pq')) else 'csv'
+
+    if file_format == 'csv':
+        read_kwargs.setdefault('dtype', {orderid_col: str})
+        chunks = pd.read_csv(path,
+                             usecols=columns,
+                             chunksize=chunksize,
+                             **read_kwargs)
+    elif file_format == 'parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError(
+                'reading Parquet files requires pyarrow; pip install pyarrow')
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(
+            path).iter_batches(batch_size=chunksize, columns=columns))
+    else:
+        raise ValueError(
+            "file_format must be 'csv' or 'parquet', not {!r}".format(
+                file_format))
+
+    # Numeric id dtypes are applied to every chunk so partials stay compact; categories
+    # are only known once every chunk has been read.
+    id_dtypes = {
+        col: dtype
+        for col, dtype in ((orderid_col, orderid_dtype), (customerid_col,
+                                                           customerid_dtype))
+        if dtype is not None and dtype != 'category'
+    }
+
+    def reduce(frames):
+        # Sums partials by order id. Like the lines of an order, its partials must
+        # agree on its date and customer.
+        with _stage('aggregate', sum(len(frame) for frame in frames)) as stage:
+            partials = pd.concat(frames, ignore_index=True)
+            grouped = partials.groupby(orderid_col, sort=True)
+            for name in (datetime_col, customerid_col):
+                conflicts = partials[name].ne(
+                    grouped[name].transform('first')).to_numpy()
+                if conflicts.any():
+                    raise ValueError(
+                        "order {!r} has more than one value of '{}'".format(
+                            partials[orderid_col].iloc[conflicts.argmax()],
+                            name))
+            reduced = grouped.agg(aggregations).reset_index()
+            stage.rows_out = len(reduced)
+        return reduced
+
+    merged = None
+    pending = []
+    pending_rows = 0
+    for chunk in chunks:
+        # Each chunk is summed by create_transaction_log's own kernel. Returns are told
+        # apart line by line, so partial totals of an order add up to its full totals;
+        # under returns='drop' a partial only survives if it holds a purchase, and so
+        # does the order.
+        pending.append(
+            _order_log(_PandasBackend(chunk.astype(id_dtypes)), orderid_col,
+                       datetime_col, customerid_col, quantity_col,
+                       unitprice_col, returns, cancel_prefix))
+        pending_rows += len(pending[-1])
+
+        # Fold the pending partials into the running totals once they outgrow them,
+        # which keeps the total merge work linear in the number of chunks.
+        if merged is None or pending_rows > len(merged):
+            merged = reduce(([] if merged is None else [merged]) + pending)
+            pending = []
+            pending_rows = 0
+
+    if merged is None:
+        merged = pd.DataFrame({
+            orderid_col: [],
+            datetime_col: pd.Series([], dtype='datetime64[ns]'),
+            customerid_col: []
+        })
+        for total in totals:
+            merged[total] = []
+    elif pending:
+        merged = reduce([merged] + pending)
+
+    for col, dtype in ((orderid_col, orderid_dtype), (customerid_col,
+                                                      customerid_dtype)):
+        if dtype == 'category':
+            merged[col] = merged[col].astype('category')
+    for total in totals:
+        merged[total] = merged[total].astype(value_dtype)
+    return merged
+
+
+class CustomerIndex(object):
+    """
+    A customer-level view of a transaction log that is computed once and shared by every chart.
+
+    Each chart needs the same facts about a customer: when they first and last purchased,
+    which of their orders came first, and which month every order falls in. Build a
+    CustomerIndex once and pass it to any chart or pivot function in place of the
+    transaction log; the column arguments of those functions then only name the output.
+
+    Parameters
+    ----------
+    transaction_log: :obj: DataFrame
+        a Pandas DataFrame that contains your transaction log, or a pyarrow Table or
+        polars DataFrame of it.
+    datetime_col: string
+        the column in transaction_log DataFrame that denotes the datetime of an order.
+    customerid_col: string
+        the column in transaction_log DataFrame that contains the unique customer_id.
+    ordervalue_col: string, optional
+        the column in transaction_log DataFrame that contains the total value of an order.
+        Required by the charts that report revenue.
+
+    Attributes
+    ----------
+    customers: :obj: Index
+        the unique customer ids. Customer code i refers to customers[i].
+    codes: :obj: ndarray
+        the integer customer code of each order.
+    dates: :obj: ndarray
+        the datetime64[ns] of each order.
+    values: :obj: ndarray
+        the value of each order, or None if ordervalue_col was not given.
+    first_purchase: :obj: ndarray
+        the datetime64[ns] of each customer's first order, by customer code.
+    last_purchase: :obj: ndarray
+        the datetime64[ns] of each customer's last order, by customer code.
+    order: :obj: ndarray
+        the permutation that sorts orders by customer, then by time. Sorted on first use,
+        as only the distinct customer counts and first orders need it.
+    first_order: :obj: ndarray
+        boolean flag marking each customer's first order in time.
+    """
+    __slots__ = ('datetime_col', 'customerid_col', 'ordervalue_col', 'customers',
+                 'codes', 'dates', 'values', 'first_purchase', 'last_purchase',
+                 '_order', '_first_order', '_period_codes', '_cohort_codes',
+                 '_time_order', '_source')
+
+    def __init__(self,
+                 transaction_log,
+                 datetime_col,
+                 customerid_col,
+                 ordervalue_col=None):
+        self.datetime_col = datetime_col
+        self.customerid_col = customerid_col
+        self.ordervalue_col = ordervalue_col
+
+        with _stage('parse', len(transaction_log)) as stage:
+            backend = _backend(transaction_log)
+            codes, self.customers = backend.factorize(customerid_col)
+            if (codes < 0).any():
+                raise ValueError(
+                    "'{}' contains missing customer ids".format(customerid_col))
+            self.codes = codes
+            self.dates = backend.datetimes(datetime_col)
+            if np.isnat(self.dates).any():
+                raise ValueError(
+                    "'{}' contains missing datetimes".format(datetime_col))
+            if ordervalue_col is None:
+                self.values = None
+            else:
+                self.values = backend.numbers(ordervalue_col)
+            stage.rows_out = len(self.customers)
+
+        # A customer's first and last purchase are a per-customer min and max, which
+        # need no sort
+        with _stage('first-purchase', len(self.codes)) as stage:
+            times = self.dates.view(np.int64)
+            first = np.full(len(self.customers), np.iinfo(np.int64).max)
+            last = np.full(len(self.customers), np.iinfo(np.int64).min)
+            np.minimum.at(first, codes, times)
+            np.maximum.at(last, codes, times)
+            self.first_purchase = first.view('datetime64[ns]')
+            self.last_purchase = last.view('datetime64[ns]')
+            stage.rows_out = len(self.customers)
+
+        self._order = None
+        self._first_order = None
+        self._period_codes = {}
+        self._cohort_codes = {}
+        self._time_order = None
+        self._source = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def n_customers(self):
+        return len(self.customers)
+
+    @property
+    def order(self):
+        if self._order is None:
+            # Sort orders by customer, then time. lexsort is stable, so orders placed at
+            # the same instant keep their file order.
+            with _stage('first-purchase', len(self.codes)):
+                self._order = np.lexsort(
+                    (self.dates.view(np.int64), self.codes))
+        return self._order
+
+    @property
+    def first_order(self):
+        if self._first_order is None and self._source is not None:
+            # A selection's first orders are those of the whole log
+            source, rows = self._source
+            self._first_order = source.first_order[rows]
+        if self._first_order is None:
+            # A customer's first order is the first row, in file order, placed at
+            # their first purchase, as in a stable sort by time; no sort is needed
+            with _stage('first-purchase', len(self.codes)) as stage:
+                rows = np.flatnonzero(
+                    self.dates == self.first_purchase[self.codes])
+                firsts = np.full(self.n_customers, len(self.codes))
+                np.minimum.at(firsts, self.codes[rows], rows)
+                firsts = firsts[firsts < len(self.codes)]
+                self._first_order = np.zeros(len(self.codes), dtype=bool)
+                self._first_order[firsts] = True
+                stage.rows_out = len(firsts)
+        return self._first_order
+
+    def period_codes(self, freq='M'):
+        """
+        Returns the period of each order as an int64 period code. Cached per freq.
+        """
+        if freq not in self._period_codes:
+            with _stage('bucket', len(self.dates)):
+                self._period_codes[freq] = _period_codes(self.dates, freq)
+        return self._period_codes[freq]
+
+    def cohort_codes(self, freq='M'):
+        """
+        Returns the period of each customer's first purchase, by customer code. Cached
+        per freq.
+        """
+        if freq not in self._cohort_codes:
+            self._cohort_codes[freq] = _period_codes(self.first_purchase, freq)
+        return self._cohort_codes[freq]
+
+    def distinct_customers(self, groups, n_groups, mask=None):
+        """
+        Counts the distinct customers in each group, in one pass over the orders.
+
+        groups holds a code in 0..n_groups-1 for each order, and must never decrease
+        over a customer's orders in time, as with period codes or cohort x period cells.
+        mask optionally selects the orders to count.
+        """
+        order = self.order if mask is None else self.order[mask[self.order]]
+        return _distinct_count(self.codes, groups, n_groups, order)
+
+    def require_values(self):
+        if self.values is None:
+            raise ValueError(
+                'this CustomerIndex was built without an ordervalue_col')
+        return self.values
+
+    def select(self, start=None, end=None, customers=None):
+        """
+        Returns the orders placed from start up to (not including) end by the given
+        customers, as an index of the same kind. Either bound and the customers may be
+        left out.
+
+        Only the orders are filtered: first purchases, cohorts and first orders are still
+        those of the whole log, so a customer whose first order predates start counts
+        as a repeat buyer of their original cohort. Time bounds are found by binary
+        search over the orders sorted by time, sorted on the first selection by time,
+        and customers by their run of rows in the orders sorted by customer.
+
+        Parameters
+        ----------
+        start: datetime-like, optional
+            the first instant to keep orders from.
+        end: datetime-like, optional
+            the instant to keep orders up to, not included.
+        customers: list-like, optional
+            the customer ids to keep orders of. Ids without any orders are ignored.
+        -------
+        :obj: CustomerIndex
+        """
+        with _stage('parse', len(self)) as stage:
+            if customers is not None:
+                codes = self.customers.get_indexer(pd.Index(customers).unique())
+                rows = _run_rows(self._runs(), codes[codes >= 0])
+                if not isinstance(self, TransactionLog):
+                    rows = self.order[rows]
+                if start is not None or end is not None:
+                    dates = self.dates[rows]
+                    keep = np.ones(len(rows), dtype=bool)
+                    if start is not None:
+                        keep &= dates >= _timestamp(start)
+                    if end is not None:
+                        keep &= dates < _timestamp(end)
+                    rows = rows[keep]
+            else:
+                # Binary search the orders sorted by time for the bounds. The sort is
+                # kept, so later selections from this index only search.
+                if self._time_order is None:
+                    order = np.argsort(self.dates, kind='stable')
+                    self._time_order = order, self.dates[order]
+                order, by_time = self._time_order
+                low = 0 if start is None else np.searchsorted(
+                    by_time, _timestamp(start))
+                high = len(by_time) if end is None else np.searchsorted(
+                    by_time, _timestamp(end))
+                rows = order[low:high]
+            rows = np.sort(rows)
+            stage.rows_out = len(rows)
+        return self._subset(rows)
+
+    def _runs(self):
+        # Where each customer's run of rows starts in order, plus the number of rows
+        return np.append(0, np.cumsum(np.bincount(self.codes,
+                                                  minlength=self.n_customers)))
+
+    def _subset(self, rows):
+        subset = object.__new__(type(self))
+        for name in ('datetime_col', 'customerid_col', 'ordervalue_col',
+                     'customers', 'first_purchase', 'last_purchase'):
+            setattr(subset, name, getattr(self, name))
+        subset.codes = self.codes[rows]
+        subset.dates = self.dates[rows]
+        subset.values = None if self.values is None else self.values[rows]
+        subset._order = None
+        subset._first_order = None
+        subset._period_codes = {
+            freq: codes[rows]
+            for freq, codes in self._period_codes.items()
+        }
+        subset._cohort_codes = self._cohort_codes
+        subset._time_order = None
+        subset._source = (self, rows)
+        return subset
+
+
+class TransactionLog(CustomerIndex):
+    """
+    A compact transaction log, sorted by customer and time and validated once.
+
+    Orders are held in three contiguous arrays: an int32 customer code (looked up in
+    customers), an int64 nanosecond timestamp and a float32 order value. Sorting by
+    customer makes each customer's orders one run of rows, so first purchases and first
+    orders are read off the run starts rather than computed per chart. A TransactionLog
+    is a CustomerIndex, and can be passed to every chart and table in place of the
+    DataFrame it was built from; they then skip parsing and coercing its columns.
+
+    Parameters
+    ----------
+    transaction_log: :obj: DataFrame
+        a Pandas DataFrame that contains your transaction log, or a pyarrow Table or
+        polars DataFrame of it.
+    datetime_col: string
+        the column in transaction_log DataFrame that denotes the datetime of an order.
+    customerid_col: string
+        the column in transaction_log DataFrame that contains the unique customer_id.
+    ordervalue_col: string, optional
+        the column in transaction_log DataFrame that contains the total value of an order.
+        Required by the charts that report revenue.
+    value_dtype: dtype, optional
+        the dtype order values are stored in. float32 holds about 7 significant digits;
+        pass np.float64 to keep values exactly.
+
+    Attributes
+    ----------
+    starts: :obj: ndarray
+        the row of each customer's first order, by customer code, followed by the number
+        of rows; customer i's orders are rows starts[i] to starts[i + 1]. Customers
+        without any orders in a selection have an empty run.
+    """
+    __slots__ = ('starts', )
+
+    def __init__(self,
+                 transaction_log,
+                 datetime_col,
+                 customerid_col,
+                 ordervalue_col=None,
+                 value_dtype=np.float32):
+        self.datetime_col = datetime_col
+        self.customerid_col = customerid_col
+        self.ordervalue_col = ordervalue_col
+
+        with _stage('parse', len(transaction_log)) as stage:
+            backend = _backend(transaction_log)
+            codes, self.customers = backend.factorize(customerid_col)
+            if (codes < 0).any():
+                raise ValueError(
+                    "'{}' contains missing customer ids".format(customerid_col))
+            if len(self.customers) > np.iinfo(np.int32).max:
+                raise ValueError('too many customers for int32 customer codes')
+            times = backend.datetimes(datetime_col).view(np.int64)
+            if (times == np.iinfo(np.int64).min).any():
+                raise ValueError(
+                    "'{}' contains missing datetimes".format(datetime_col))
+            values = None
+            if ordervalue_col is not None:
+                values = backend.numbers(ordervalue_col, dtype=value_dtype)
+                if not np.isfinite(values).all():
+                    raise ValueError(
+                        "'{}' contains missing or infinite order values".format(
+                            ordervalue_col))
+            stage.rows_out = len(self.customers)
+
+        # Sort once by customer, then time; lexsort is stable, so orders placed at the
+        # same instant keep their file order
+        with _stage('first-purchase', len(codes)) as stage:
+            order = np.lexsort((times, codes))
+            codes = codes[order]
+            self.codes = codes.astype(np.int32)
+            self.dates = times[order].view('datetime64[ns]')
+            self.values = None if values is None else values[order]
+            del order, times, values
+            self.starts = np.append(
+                np.flatnonzero(np.diff(codes, prepend=-1)), len(codes))
+            self.first_purchase = self.dates[self.starts[:-1]]
+            self.last_purchase = self.dates[self.starts[1:] - 1]
+            stage.rows_out = len(self.customers)
+
+        self._order = None
+        self._first_order = None
+        self._period_codes = {}
+        self._cohort_codes = {}
+        self._time_order = None
+        self._source = None
+
+    @property
+    def order(self):
+        # Rows are already in customer, time order
+        if self._order is None:
+            self._order = np.arange(len(self.codes))
+        return self._order
+
+    @property
+    def first_order(self):
+        if self._first_order is None and self._source is not None:
+            source, rows = self._source
+            self._first_order = source.first_order[rows]
+        if self._first_order is None:
+            self._first_order = np.zeros(len(self.codes), dtype=bool)
+            self._first_order[self.starts[:-1]] = True
+        return self._first_order
+
+    def distinct_customers(self, groups, n_groups, mask=None):
+        order = slice(None) if mask is None else np.flatnonzero(mask)
+        return _distinct_count(self.codes, groups, n_groups, order)
+
+    def _runs(self):
+        return self.starts
+
+    def _subset(self, rows):
+        # Selected rows keep the customer, time order, so their runs are searched for
+        subset = CustomerIndex._subset(self, rows)
+        subset.starts = np.searchsorted(subset.codes,
+                                        np.arange(self.n_customers + 1))
+        if self._first_order is not None:
+            subset._first_order = self._first_order[rows]
+        return subset
+
+    def to_frame(self):
+        """
+        Returns the orders as a DataFrame with the columns the log was built from, in
+        customer and time order.
+        """
+        columns = {
+            self.datetime_col: self.dates,
+            self.customerid_col: self.customers.take(self.codes)
+        }
+        if self.values is not None:
+            columns[self.ordervalue_col] = self.values
+        return pd.DataFrame(columns)
+
+    def save(self, path):
+        """
+        Saves the log to the directory path, one .npy file per array, so that load can
+        memory-map it. A meta.json header holds the column names, the sort order and the
+        range of order dates; the customer ids are saved as customers.npy.
+        """
+        os.makedirs(path, exist_ok=True)
+        customers = self.customers.to_numpy()
+        if customers.dtype == object:
+            customers = customers.astype(str)
+        arrays = {
+            'customers': customers,
+            'codes': self.codes,
+            'dates': self.dates,
+            'starts': self.starts,
+            'first_purchase': self.first_purchase,
+            'last_purchase': self.last_purchase
+        }
+        if self.values is not None:
+            arrays['values'] = self.values
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), array)
+        meta = {
+            'format': 1,
+            'datetime_col': self.datetime_col,
+            'customerid_col': self.customerid_col,
+            'ordervalue_col': self.ordervalue_col,
+            'sorted_by': ['customer', 'time'],
+            'n_orders': len(self),
+            'n_customers': self.n_customers,
+            'start': None,
+            'end': None
+        }
+        if len(self):
+            meta['start'] = str(self.first_purchase.min())
+            meta['end'] = str(self.last_purchase.max())
+        # The header is written last, so a directory without one is an incomplete save
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Opens a log saved with TransactionLog.save. By default its arrays are
+        memory-mapped read-only rather than read, so opening it takes milliseconds and
+        processes that open the same log share one copy in the page cache.
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('format') != 1:
+            raise ValueError('{} is not a TransactionLog store'.format(path))
+
+        def array(name):
+            return np.load(os.path.join(path, name + '.npy'),
+                           mmap_mode=mmap_mode,
+                           allow_pickle=False)
+
+        log = cls.__new__(cls)
+        log.datetime_col = meta['datetime_col']
+        log.customerid_col = meta['customerid_col']
+        log.ordervalue_col = meta['ordervalue_col']
+        log.customers = pd.Index(array('customers'))
+        log.codes = array('codes')
+        log.dates = array('dates')
+        log.values = None if meta['ordervalue_col'] is None else array('values')
+        log.starts = np.asarray(array('starts'))
+        log.first_purchase = array('first_purchase')
+        log.last_purchase = array('last_purchase')
+        log._order = None
+        log._first_order = None
+        log._period_codes = {}
+        log._cohort_codes = {}
+        log._time_order = None
+        log._source = None
+        return log
+
+
+def _run_rows(starts, codes):
+    # The rows of the runs of the given customer codes, one run after another
+    lengths = starts[codes + 1] - starts[codes]
+    offsets = np.repeat(starts[codes] - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+def _timestamp(value):
+    return pd.Timestamp(value).to_datetime64().astype('datetime64[ns]')
+
+
+def _select(transaction_log, datetime_col, customerid_col, ordervalue_col, start,
+            end, customers):
+    # Applies the start, end and customers filters of a chart or table, if any
+    if start is None and end is None and customers is None:
+        return transaction_log
+    if isinstance(transaction_log, CohortState):
+        raise ValueError('start, end and customers need a transaction log or '
+                         'CustomerIndex, not a CohortState')
+    if isinstance(transaction_log, CustomerIndex):
+        return transaction_log.select(start, end, customers)
+
+    # An index built for this call alone is filtered in one pass over its orders. The
+    # sorts that select() searches would cost more than that pass, and be thrown away
+    # with the index.
+    index = CustomerIndex(transaction_log, datetime_col, customerid_col,
+                          ordervalue_col)
+    with _stage('parse', len(index)) as stage:
+        keep = np.ones(len(index), dtype=bool)
+        if start is not None:
+            keep &= index.dates >= _timestamp(start)
+        if end is not None:
+            keep &= index.dates < _timestamp(end)
+        if customers is not None:
+            codes = index.customers.get_indexer(pd.Index(customers).unique())
+            wanted = np.zeros(index.n_customers, dtype=bool)
+            wanted[codes[codes >= 0]] = True
+            keep &= wanted[index.codes]
+        rows = np.flatnonzero(keep)
+        stage.rows_out = len(rows)
+    return index._subset(rows)
+
+
+def _distinct_count(codes, groups, n_groups, order=None):
+    # Exact count of distinct codes per group. Once rows are sorted by (code, group),
+    # each distinct pair starts where either key changes, so a single comparison pass
+    # and a bincount replace a groupby nunique. order may be passed in when rows are
+    # already sorted that way, e.g. by customer then time for period codes.
+    if order is None:
+        order = np.lexsort((groups, codes))
+    codes = codes[order]
+    groups = groups[order]
+    starts = np.empty(len(codes), dtype=bool)
+    starts[:1] = True
+    np.not_equal(codes[1:], codes[:-1], out=starts[1:])
+    starts[1:] |= groups[1:] != groups[:-1]
+    return np.bincount(groups[starts], minlength=n_groups)
+
+
+def _nonzero_cells(matrix, origin):
+    # Non-empty cells of a square cohort x period matrix whose first row and column
+    # are period code origin, as a Series indexed by (CohortGroup, OrderPeriod)
+    rows, cols = np.nonzero(matrix)
+    return pd.Series(matrix[rows, cols],
+                     index=pd.MultiIndex.from_arrays(
+                         [rows + origin, cols + origin],
+                         names=['CohortGroup', 'OrderPeriod']),
+                     name='TotalUsers')
+
+
+def _customer_index(transaction_log,
+                    datetime_col,
+                    customerid_col,
+                    ordervalue_col=None):
+    # Charts accept either a transaction log or a prebuilt CustomerIndex
+    if isinstance(transaction_log, CustomerIndex):
+        return transaction_log
+    return CustomerIndex(transaction_log, datetime_col, customerid_col,
+                         ordervalue_col)
+
+
+# Period codes are int64 counts of whole periods since the epoch, so that bucketing a
+# column of dates is a single vectorized cast. Labels are only built, at render time,
+# for the few distinct codes that survive aggregation.
+PERIODS = ('D', 'W', 'M', 'Q', 'Y')
+
+
+def _period_codes(dates, freq='M'):
+    dates = np.asarray(dates)
+    if freq == 'D':
+        return dates.astype('datetime64[D]').astype(np.int64)
+    if freq == 'W':
+        # 1970-01-01 was a Thursday; shift by 3 days so weeks start on Monday
+        return (dates.astype('datetime64[D]').astype(np.int64) + 3) // 7
+    if freq == 'M':
+        return dates.astype('datetime64[M]').astype(np.int64)
+    if freq == 'Q':
+        return dates.astype('datetime64[M]').astype(np.int64) // 3
+    if freq == 'Y':
+        return dates.astype('datetime64[Y]').astype(np.int64)
+    raise ValueError('freq must be one of {}, not {!r}'.format(PERIODS, freq))
+
+
+def _period_starts(codes, freq='M'):
+    # datetime64[ns] of the first instant of each period code
+    codes = np.asarray(codes, dtype=np.int64)
+    if freq == 'D':
+        starts = codes.astype('datetime64[D]')
+    elif freq == 'W':
+        starts = (codes * 7 - 3).astype('datetime64[D]')
+    elif freq == 'M':
+        starts = codes.astype('datetime64[M]')
+    elif freq == 'Q':
+        starts = (codes * 3).astype('datetime64[M]')
+    elif freq == 'Y':
+        starts = codes.astype('datetime64[Y]')
+    else:
+        raise ValueError('freq must be one of {}, not {!r}'.format(
+            PERIODS, freq))
+    return starts.astype('datetime64[ns]')
+
+
+def _period_ends(codes, freq='M'):
+    # datetime64[ns] of the midnight starting the last day of each period code, which is
+    # how pd.Grouper labels its periods (weeks end on Sunday)
+    codes = np.asarray(codes, dtype=np.int64)
+    return _period_starts(codes + 1, freq) - np.timedelta64(1, 'D')
+
+
+def _period_labels(codes, freq='M', name=None):
+    # 'YYYY-MM-DD' for days and weeks (the Monday), 'YYYY-MM', 'Q1 2020' and 'YYYY'
+    codes = np.asarray(codes, dtype=np.int64)
+    if freq == 'Q':
+        labels = [
+            'Q{} {}'.format(q % 4 + 1, 1970 + q // 4) for q in codes.tolist()
+        ]
+    else:
+        unit = {'D': 'D', 'W': 'D', 'M': 'M', 'Y': 'Y'}.get(freq)
+        if unit is None:
+            raise ValueError('freq must be one of {}, not {!r}'.format(
+                PERIODS, freq))
+        labels = np.datetime_as_string(_period_starts(codes, freq),
+                                       unit=unit)
+    return pd.Index(labels, name=name)
+
+
+def _cohort_arrays(index, freq, first, n_periods, kinds):
+    # Dense arrays over period codes first..first+n_periods-1, by kind:
+    #   'users', 'orders', 'revenue': cohort (rows) x order period (columns)
+    #   'type_users', 'type_orders', 'type_revenue': initial (row 0) and repeat (row 1)
+    #   buyers by order period
+    # Every array is a sum over customers, so the arrays of customer-disjoint shards of
+    # a transaction log add up to the arrays of the whole log.
+    periods = index.period_codes(freq) - first
+    with _stage('aggregate', len(index)) as stage:
+        arrays = {}
+        if {'users', 'orders', 'revenue'} & set(kinds):
+            cells = (index.cohort_codes(freq)[index.codes] -
+                     first) * n_periods + periods
+            n_cells = n_periods * n_periods
+            if 'users' in kinds:
+                arrays['users'] = index.distinct_customers(cells, n_cells)
+            if 'orders' in kinds:
+                arrays['orders'] = np.bincount(cells, minlength=n_cells)
+            if 'revenue' in kinds:
+                arrays['revenue'] = np.bincount(cells,
+                                                weights=index.require_values(),
+                                                minlength=n_cells)
+            for kind in arrays:
+                arrays[kind] = arrays[kind].reshape(n_periods, n_periods)
+
+        if {'type_users', 'type_orders', 'type_revenue'} & set(kinds):
+            # Row 0 holds each customer's first order in time, row 1 every later order
+            ob = ~index.first_order
+            cells = ob * n_periods + periods
+            orders = np.bincount(cells, minlength=2 * n_periods).reshape(
+                2, n_periods)
+            if 'type_orders' in kinds:
+                arrays['type_orders'] = orders
+            if 'type_users' in kinds:
+                # Each buyer has exactly one first order
+                arrays['type_users'] = np.stack([
+                    orders[0],
+                    index.distinct_customers(periods, n_periods, mask=ob)
+                ])
+            if 'type_revenue' in kinds:
+                arrays['type_revenue'] = np.bincount(
+                    cells,
+                    weights=index.require_values(),
+                    minlength=2 * n_periods).reshape(2, n_periods)
+        stage.rows_out = n_periods
+    return arrays
+
+
+def _code_span(*codes):
+    # (first, n) such that codes first..first+n-1 cover every given array of period
+    # codes; (0, 0) when they are all empty, as for an empty selection
+    codes = [values for values in codes if len(values)]
+    if not codes:
+        return 0, 0
+    first = min(values.min() for values in codes)
+    return first, max(values.max() for values in codes) - first + 1
+
+
+def _n_workers(n_jobs):
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(os.cpu_count() + 1 + n_jobs, 1)
+    return max(n_jobs, 1)
+
+
+def _cohort_data(transaction_log,
+                 datetime_col,
+                 customerid_col,
+                 ordervalue_col,
+                 freq,
+                 kinds,
+                 n_jobs=None):
+    # (first period code, arrays) of _cohort_arrays over the whole transaction log,
+    # computed in worker processes when n_jobs asks for more than one.
+    if isinstance(transaction_log, CustomerIndex) or _n_workers(n_jobs) == 1:
+        index = _customer_index(transaction_log, datetime_col, customerid_col,
+                                ordervalue_col)
+        periods = index.period_codes(freq)
+        if index._source is not None:
+            # A selection can hold orders of customers acquired before its first period
+            first, n_periods = _code_span(periods,
+                                          index.cohort_codes(freq)[index.codes])
+        else:
+            first, n_periods = _code_span(periods)
+        return first, _cohort_arrays(index, freq, first, n_periods, kinds)
+    return _parallel_cohort_data(transaction_log, datetime_col, customerid_col,
+                                 ordervalue_col, freq, kinds,
+                                 _n_workers(n_jobs))
+
+
+# The columns and shard labels of the running parallel job. Workers forked while it
+# is set inherit the arrays instead of having copies pickled over to them.
+_SHARED = {}
+
+
+def _parallel_cohort_data(transaction_log, datetime_col, customerid_col,
+                          ordervalue_col, freq, kinds, n_workers):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    columns = (datetime_col, customerid_col, ordervalue_col)
+    with _stage('parse', len(transaction_log)):
+        backend = _backend(transaction_log)
+        data = {
+            col: np.asarray(backend.column(col))
+            for col in columns if col is not None
+        }
+        data[datetime_col] = backend.datetimes(datetime_col)
+        if np.isnat(data[datetime_col]).any():
+            raise ValueError(
+                "'{}' contains missing datetimes".format(datetime_col))
+    with _stage('bucket', len(transaction_log)):
+        # Periods only grow with time, so the span of period codes is that of the
+        # earliest and latest orders, and the workers bucket their own orders
+        dates = data[datetime_col]
+        bounds = dates[[dates.argmin(), dates.argmax()]] if len(dates) else dates
+        first, n_periods = _code_span(_period_codes(bounds, freq))
+
+    # Hash-partition by customer, so that every customer's orders land in one shard
+    # and the shards' arrays simply add up. The rows are partitioned once, by a stable
+    # sort on the shard label, so shard i's rows are order[bounds[i]:bounds[i + 1]],
+    # still in file order, and no worker scans the rows of the others.
+    with _stage('bucket', len(transaction_log)):
+        labels = _customer_hashes(data[customerid_col]) % np.uint64(n_workers)
+        order = np.argsort(labels, kind='stable')
+        bounds = np.append(
+            0, np.cumsum(np.bincount(labels.astype(np.intp),
+                                     minlength=n_workers)))
+        del labels
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+        _SHARED.update(data=data, order=order)
+        shards = [None] * n_workers
+    else:
+        context = None
+        shards = [{
+            col: values[order[bounds[shard]:bounds[shard + 1]]]
+            for col, values in data.items()
+        } for shard in range(n_workers)]
+    with _stage('aggregate', len(transaction_log)) as stage:
+        try:
+            with ProcessPoolExecutor(n_workers, mp_context=context) as pool:
+                partials = [
+                    pool.submit(_shard_arrays, bounds[shard], bounds[shard + 1],
+                                shards[shard], columns, freq, first, n_periods,
+                                kinds) for shard in range(n_workers)
+                ]
+                partials = [partial.result() for partial in partials]
+        finally:
+            _SHARED.clear()
+        stage.rows_out = n_periods
+    return first, {
+        kind: sum(partial[kind] for partial in partials)
+        for kind in kinds
+    }
+
+
+def _shard_arrays(low, high, data, columns, freq, first, n_periods, kinds):
+    # Runs in a worker process: _cohort_arrays over one shard's orders, which are rows
+    # order[low:high] of the shared columns when data is None. The stages of workers
+    # are not profiled.
+    del _profilers[:]
+    if data is None:
+        rows = _SHARED['order'][low:high]
+        data = {col: values[rows] for col, values in _SHARED['data'].items()}
+    index = CustomerIndex(pd.DataFrame(data), *columns)
+    return _cohort_arrays(index, freq, first, n_periods, kinds)
+
+
+def _dense_pivot(values, counts, origin):
+    # The rows and columns of a square cohort x period matrix that hold any orders, as a
+    # DataFrame indexed by period codes. Cells without orders are NaN.
+    rows = np.flatnonzero(counts.any(axis=1))
+    cols = np.flatnonzero(counts.any(axis=0))
+    cells = np.ix_(rows, cols)
+    return pd.DataFrame(np.where(counts[cells] > 0, values[cells], np.nan),
+                        index=rows + origin,
+                        columns=cols + origin)
+
+
+def _segment_codes(frame, segment_col, index):
+    # The segment code of each of index's orders, and the segment labels they code,
+    # sorted. index was built from frame, possibly then narrowed by _select.
+    if isinstance(frame, (CustomerIndex, CohortState)):
+        raise ValueError('segment_col needs a transaction log table')
+    codes, labels = _backend(frame).factorize(segment_col, sort=True)
+    if (codes < 0).any():
+        raise ValueError("'{}' contains missing segments".format(segment_col))
+    if index._source is not None:
+        codes = codes[index._source[1]]
+    return codes, labels
+
+
+def _segment_index(labels, segment_col, segments, periods, freq, name):
+    # A (segment, period label) MultiIndex over the given segment and period codes
+    distinct, inverse = np.unique(periods, return_inverse=True)
+    period_labels = _period_labels(distinct, freq, name=name)
+    return pd.MultiIndex.from_arrays(
+        [labels.take(segments),
+         period_labels.take(inverse)],
+        names=[segment_col, name])
+
+
+def _segmented_sales(frame, index, segment_col, datetime_col, ordervalue_col,
+                     customerid_col, freq, approx, error):
+    # sales_table of every segment at once, keyed by segment * n_periods + period
+    segments, labels = _segment_codes(frame, segment_col, index)
+    periods = index.period_codes(freq)
+    with _stage('aggregate', len(periods)) as stage:
+        first, n_periods = _code_span(periods)
+        n_keys = len(labels) * n_periods
+        keys = segments * n_periods + (periods - first)
+        revenue = np.bincount(keys,
+                              weights=index.require_values(),
+                              minlength=n_keys)
+        if approx:
+            sketch = CustomerSketch.build(
+                _customer_hashes(index.customers)[index.codes], keys, freq,
+                CustomerSketch.precision_for(error))
+            customers = np.zeros(n_keys, dtype=np.int64)
+            customers[sketch.keys[:, 0]] = sketch.estimate().round().to_numpy()
+        else:
+            customers = _distinct_count(index.codes, keys, n_keys)
+        stage.rows_out = n_keys
+    with _stage('pivot', n_keys):
+        cells = np.arange(n_keys)
+        return pd.DataFrame(
+            {
+                ordervalue_col: revenue,
+                customerid_col: customers
+            },
+            index=pd.MultiIndex.from_arrays([
+                labels.take(cells // n_periods),
+                pd.DatetimeIndex(_period_ends(cells % n_periods + first, freq))
+            ],
+                                            names=[segment_col, datetime_col]))
+
+
+def _segmented_new_customers(frame, index, segment_col, freq):
+    # new_customers_table of every segment at once. A customer is a new buyer of the
+    # segment of their first order.
+    segments, labels = _segment_codes(frame, segment_col, index)
+    firsts = index.first_order
+    with _stage('aggregate', len(firsts)) as stage:
+        cohorts = index.cohort_codes(freq)[index.codes[firsts]]
+        origin, n_periods = _code_span(cohorts)
+        keys, new_buyers = np.unique(segments[firsts] * n_periods +
+                                     (cohorts - origin),
+                                     return_counts=True)
+        stage.rows_out = len(keys)
+    with _stage('pivot', len(keys)):
+        return pd.DataFrame({'TotalUsers': new_buyers},
+                            index=_segment_index(labels, segment_col,
+                                                 keys // n_periods,
+                                                 keys % n_periods + origin, freq,
+                                                 'CohortGroup'))
+
+
+def _segmented_buyer_types(frame, index, segment_col, freq, kind):
+    # customer_type_revenue_table ('type_revenue') or customer_type_count_table
+    # ('type_users') of every segment at once, over the periods each segment has orders
+    # in. Orders are keyed by (segment, buyer type, period).
+    segments, labels = _segment_codes(frame, segment_col, index)
+    periods = index.period_codes(freq)
+    with _stage('aggregate', len(periods)) as stage:
+        first, n_periods = _code_span(periods)
+        n_keys = len(labels) * 2 * n_periods
+        repeat = ~index.first_order
+        keys = (segments * 2 + repeat) * n_periods + (periods - first)
+        shape = (len(labels), 2, n_periods)
+        orders = np.bincount(keys, minlength=n_keys).reshape(shape)
+        if kind == 'type_revenue':
+            by_type = np.bincount(keys,
+                                  weights=index.require_values(),
+                                  minlength=n_keys).reshape(shape)
+        else:
+            # Each buyer has exactly one first order; repeat buyers are distinct
+            by_type = orders.copy()
+            by_type[:, 1] = _distinct_count(index.codes[repeat], keys[repeat],
+                                            n_keys).reshape(shape)[:, 1]
+        stage.rows_out = n_keys
+    with _stage('pivot', n_keys):
+        segments, cols = np.nonzero(orders.sum(axis=1))
+        return pd.DataFrame(
+            {
+                'InitialBuyers': by_type[segments, 0, cols],
+                'RepeatBuyers': by_type[segments, 1, cols]
+            },
+            index=_segment_index(labels, segment_col, segments, cols + first,
+                                 freq, 'OrderPeriod'))
+
+
+def _buyer_type_frame(by_type, active, origin, freq):
+    # An initial (row 0) and repeat (row 1) buyers array as a DataFrame over the periods
+    # where active is non-zero. A buyer type missing from such a period counts 0.
+    cols = np.flatnonzero(active)
+    with _stage('pivot', len(active)):
+        return pd.DataFrame(
+            {
+                'InitialBuyers': by_type[0, cols],
+                'RepeatBuyers': by_type[1, cols]
+            },
+            index=_period_labels(cols + origin, freq, name='OrderPeriod'))
+
+
+def _new_axes(figsize, show):
+    # Axes on a new figure of their own. Shown figures are made through pyplot, so that
+    # notebooks display them; the rest are bare Figures, which never touch pyplot's
+    # global state and are freed as soon as they are dropped.
+    if show:
+        import matplotlib.pyplot as plt
+        return plt.subplots(figsize=figsize)[1]
+    from matplotlib.figure import Figure
+    return Figure(figsize=figsize).subplots()
+
+
+_WEBGL_POINTS = 1000
+
+
+def _line_trace(n_points):
+    # WebGL draws long lines much faster than SVG; short ones are left as SVG, which
+    # every renderer supports
+    import plotly.graph_objects as go
+    return go.Scattergl if n_points > _WEBGL_POINTS else go.Scatter
+
+
+def _buyer_type_bars(df, figsize, rotation, ylabel, show=True):
+    # Stacked bars of each buyer type's percent of every period's total
+    with _stage('render', len(df)):
+        values = df[['InitialBuyers', 'RepeatBuyers']].to_numpy(dtype=np.float64)
+        shares = values / values.sum(axis=1, keepdims=True) * 100
+        r = np.arange(len(df))
+        ax = _new_axes(figsize, show)
+
+        # Plot Dimensions
+        barWidth = 0.85
+
+        # Create Initial Buyer Bars
+        ax.bar(r,
+               shares[:, 0],
+               color='#08A05C',
+               edgecolor='white',
+               width=barWidth,
+               label='New Buyers')
+
+        # Create Repeat Buyer Bars
+        ax.bar(r,
+               shares[:, 1],
+               bottom=shares[:, 0],
+               color='#f9bc86',
+               edgecolor='white',
+               width=barWidth,
+               label='Repeat Buyers')
+
+        # Labels and Legend
+        ax.set_xticks(r)
+        ax.set_xticklabels(df.index.to_numpy(), rotation=rotation)
+        ax.set_ylabel(ylabel)
+        ax.legend(loc='upper left', bbox_to_anchor=(1, 1), ncol=1)
+        if show:
+            import matplotlib.pyplot as plt
+            plt.show()
+    return ax
+
+
+def _draw_sales(df, customerid_col, ordervalue_col, customer_count, title,
+                ylabel1, ylabel2, show):
+    # sales_chart's figure, from its table
+    import plotly.graph_objects as go
+
+    # Plotting a dual axist chart depending on the user's preference, else
+    # plot revenue/sales per month.
+    # The figure is built in one call from the table's arrays.
+    with _stage('render', len(df)):
+        x = df.index.to_numpy()
+        revenue = df[ordervalue_col].to_numpy()
+        if customer_count == True:
+            fig = go.Figure(
+                data=[
+                    _line_trace(len(df))(x=x,
+                                         y=df[customerid_col].to_numpy(),
+                                         name=ylabel1,
+                                         yaxis='y2'),
+                    go.Bar(x=x, y=revenue, name=ylabel2)
+                ],
+                layout=dict(title_text=title,
+                            yaxis=dict(title_text=ylabel2, tickformat='$,'),
+                            yaxis2=dict(title_text=ylabel1,
+                                        tickformat=',',
+                                        rangemode='tozero',
+                                        overlaying='y',
+                                        side='right')))
+        else:
+            fig = go.Figure(data=[
+                go.Bar(x=x, y=revenue, marker_color='#08A05C', name=ylabel2)
+            ],
+                            layout=dict(title_text=title,
+                                        xaxis=dict(title_text='Month-Year'),
+                                        yaxis=dict(title_text=ylabel2,
+                                                   tickformat='$,')))
+        if show:
+            fig.show()
+    return fig
+
+
+def _draw_retention(user_retention, cohorts, title, ylabel, max_age, show):
+    # cohort_retention_chart's figure, from its table
+    with _stage('render', len(user_retention)):
+        if cohorts:
+            user_retention = user_retention[list(cohorts)]
+        if max_age is None:
+            max_age = len(user_retention)
+        shown = user_retention.loc[:max_age]
+        ax = _new_axes((10, 5), show)
+        ax.plot(shown.index.to_numpy(),
+                shown.to_numpy(),
+                label=shown.columns.astype(str).tolist())
+        ax.legend(title=shown.columns.name)
+        ax.set_title(title)
+        ax.set_xlabel(shown.index.name)
+        ax.set_xticks(np.arange(1, max_age + 1))
+        ax.set_xlim(1, max_age)
+        ax.set_ylabel(ylabel)
+    return ax
+
+
+def _draw_new_customers(cohorts, title, xlabel, ylabel, show):
+    # new_customers_chart's figure, from its table
+    import plotly.graph_objects as go
+
+    with _stage('render', len(cohorts)):
+        fig = go.Figure(data=[
+            go.Bar(x=cohorts.index.to_numpy(),
+                   y=cohorts['TotalUsers'].to_numpy(),
+                   marker_color='#08A05C')
+        ],
+                        layout=dict(title_text=title,
+                                    xaxis=dict(title_text=xlabel),
+                                    yaxis=dict(title_text=ylabel)))
+        if show:
+            fig.show()
+    return fig
+
+
+def _draw_c3(cohort_pivot, title, show):
+    # c3_chart's figure, from its table
+    import plotly.graph_objects as go
+
+    # one stacked trace per acquisition cohort, across order quarters, all passed to
+    # the figure at once. Stacked areas have no WebGL trace type.
+    with _stage('render', len(cohort_pivot)):
+        x = cohort_pivot.columns.to_numpy()
+        fig = go.Figure(data=[
+            go.Scatter(name=name,
+                       x=x,
+                       y=y,
+                       stackgroup='one',
+                       fill='tonexty',
+                       mode='none')
+            for name, y in zip(cohort_pivot.index, cohort_pivot.to_numpy())
+        ],
+                        layout={"title": title})
+        if show:
+            fig.show()
+    return fig
+
+
+@_cached('datetime_col', 'customerid_col', 'ordervalue_col', 'segment_col')
+def sales_table(transaction_log,
+                datetime_col,
+                customerid_col,
+                ordervalue_col,
+                freq='M',
+                approx=False,
+                error=0.02,
+                start=None,
+                end=None,
+                customers=None,
+                segment_col=None):
+    """
+    Computes revenue and number of unique customers per month, as plotted by sales_chart.
+
+    Parameters
+    ----------
+    transaction_log: :obj: DataFrame
+        a Pandas DataFrame that contains your transaction log, or a CustomerIndex built from it.
+    datetime_col: string
+        the column in transaction_log DataFrame that denotes the datetime of an order.
+    customerid_col: string
+        the column in transaction_log DataFrame that contains the unique customer_id.
+    ordervalue_col: string
+        the column in transaction_log DataFrame that contains the total value of an order.
+    freq: string, optional
+        the period to bucket orders by; one of 'D', 'W', 'M', 'Q' or 'Y'.
+    approx: boolean, optional
+        estimate unique customers with HyperLogLog sketches (see customer_sketch) instead
+        of counting them exactly.
+    error: float, optional
+        the relative standard error of the estimates when approx is True.
+    start: datetime-like, optional
+        only count orders placed at or after start. Cohorts and first orders still come
+        from the whole log.
+    end: datetime-like, optional
+        only count orders placed before end.
+    customers: list-like, optional
+        only count the orders of these customer ids.
+    segment_col: string, optional
+        a column in transaction_log DataFrame that assigns each order to a segment, such
+        as a region or channel. The table is then computed for every segment in one pass
+        and indexed by segment first.
+    -------
+    :obj: DataFrame
+        revenue (ordervalue_col) and unique customers (customerid_col) per period,
+        indexed by the last day of each period and named datetime_col, as by a
+        pd.Grouper. Periods without any orders are kept.
+    """
+    frame = transaction_log
+    transaction_log = _select(transaction_log, datetime_col, customerid_col,
+                              ordervalue_col, start, end, customers)
+
+    if segment_col is not None:
+        index = _customer_index(transaction_log, datetime_col, customerid_col,
+                                ordervalue_col)
+        return _segmented_sales(frame, index, segment_col, datetime_col,
+                                ordervalue_col, customerid_col, freq, approx,
+                                error)
+    if approx and not isinstance(transaction_log, CustomerIndex):
+        # Approximate counts need no customer-level pass, so skip building an index
+        with _stage('bucket', len(transaction_log)):
+            backend = _backend(transaction_log)
+            periods = _period_codes(backend.datetimes(datetime_col), freq)
+            values = backend.numbers(ordervalue_col)
+    else:
+        index = _customer_index(transaction_log, datetime_col, customerid_col,
+                                ordervalue_col)
+        periods = index.period_codes(freq)
+        values = index.require_values()
+
+    # Aggregate data on a monthly basis from transaction log. User user_id totals to create optional stacked
+    # chart in the futre. Periods without any orders are kept.
+    with _stage('aggregate', len(periods)) as stage:
+        first, n_periods = _code_span(periods)
+        if approx:
+            customers = customer_sketch(transaction_log,
+                                        datetime_col,
+                                        customerid_col,
+                                        freq=freq,
+                                        error=error).estimate()
+            customers = customers.round().astype(np.int64).reindex(
+                np.arange(first, first + n_periods), fill_value=0).to_numpy()
+        else:
+            customers = index.distinct_customers(periods - first, n_periods)
+        revenue = np.bincount(periods - first,
+                              weights=values,
+                              minlength=n_periods)
+        stage.rows_out = n_periods
+    with _stage('pivot', n_periods):
+        return pd.DataFrame(
+            {
+                ordervalue_col: revenue,
+                customerid_col: customers
+            },
+            index=pd.DatetimeIndex(_period_ends(
+                np.arange(first, first + n_periods), freq),
+                                   name=datetime_col))
+
+
 def sales_chart(transaction_log,
                 datetime_col,
                 customerid_col,
@@ -67,14 +2188,23 @@ def sales_chart(transaction_log,
                 customer_count=True,
                 title='Sales and Customers Per Month',
                 ylabel1='Number of Customers Per Month',
-                ylabel2='Sales ($) per Month'):
+                ylabel2='Sales ($) per Month',
+                freq='M',
+                approx=False,
+                error=0.02,
+                start=None,
+                end=None,
+                customers=None,
+                segment_col=None,
+                segment=None,
+                show=True):
     """
     Creates a bar chart of monthly revenue with a line plot overlay of number of customers per month. 
     
     Parameters
     ----------
     transaction_log: :obj: DataFrame
-        a Pandas DataFrame that contains your transaction log.
+        a Pandas DataFrame that contains your transaction log, or a CustomerIndex built from it.
     datetime_col: string
         the column in transaction_log DataFrame that denotes the datetime of an order.
     ordervalue_col: string
@@ -89,136 +2219,291 @@ def sales_chart(transaction_log,
         the label for the line trace of the number of customers per month.
     ylabel2: string, optional
         the label for the bar plot of the revenue per month.
-    
+    freq: string, optional
+        the period to bucket orders by; one of 'D', 'W', 'M', 'Q' or 'Y'.
+    approx: boolean, optional
+        estimate unique customers with HyperLogLog sketches (see customer_sketch) instead
+        of counting them exactly.
+    error: float, optional
+        the relative standard error of the estimates when approx is True.
+    start: datetime-like, optional
+        only count orders placed at or after start. Cohorts and first orders still come
+        from the whole log.
+    end: datetime-like, optional
+        only count orders placed before end.
+    customers: list-like, optional
+        only count the orders of these customer ids.
+    segment_col: string, optional
+        a column in transaction_log DataFrame that assigns each order to a segment, such
+        as a region or channel. The chart is then drawn for one segment.
+    segment: optional
+        the segment to draw, when segment_col is given. With enable_cache, drawing every
+        segment in turn computes the table of all segments only once.
+    show: boolean, optional
+        display the chart. Pass False to only build and return it, e.g. for save_charts;
+        it is then neither opened in a viewer nor drawn through pyplot.
     -------
-    axes: plotly.AxesSubplot
+    fig: plotly.graph_objects.Figure
     """
+    df = sales_table(transaction_log,
+                     datetime_col,
+                     customerid_col,
+                     ordervalue_col,
+                     freq=freq,
+                     approx=approx,
+                     error=error,
+                     start=start,
+                     end=end,
+                     customers=customers,
+                     segment_col=segment_col)
+    if segment_col is not None:
+        df = df.loc[segment]
+
+    return _draw_sales(df, customerid_col, ordervalue_col, customer_count, title,
+                       ylabel1, ylabel2, show)
+
+
+@_cached('datetime_col', 'customerid_col')
+def cohort_retention_matrix(transaction_log,
+                            datetime_col,
+                            customerid_col,
+                            freq='M',
+                            approx=False,
+                            error=0.02,
+                            n_jobs=None,
+                            start=None,
+                            end=None,
+                            customers=None):
+    """
+    Computes the user retention matrix plotted by cohort_retention_chart.
 
-    # Get time format correct of date column correct
-    transaction_log[datetime_col] = pd.to_datetime(
-        transaction_log[datetime_col])
-    transaction_log = transaction_log.set_index(datetime_col)
-
-    # Aggregate data on a monthly basis from transaction log. User user_id totals to create optional stacked
-    # chart in the futre
-    df = transaction_log.groupby(
-        pd.Grouper(freq="M"))[ordervalue_col, customerid_col].agg({
-            ordervalue_col:
-            np.sum,
-            customerid_col:
-            pd.Series.nunique
-        })
-
-    # Plotting a dual axist chart depending on the user's preference, else
-    # plot revenue/sales per month.
-    if customer_count == True:
-        fig = make_subplots(specs=[[{"secondary_y": True}]])
-        fig.add_trace(go.Scatter(x=df.index,
-                                 y=df[customerid_col].values,
-                                 name=ylabel1),
-                      secondary_y=True)
-        fig.add_trace(go.Bar(x=df.index,
-                             y=df[ordervalue_col].values,
-                             name=ylabel2),
-                      secondary_y=False)
-
-        fig.update_layout(yaxis=dict(tickformat='$,'),
-                          yaxis2=dict(tickformat=',', rangemode='tozero'),
-                          title_text=title)
-        fig.update_yaxes(title_text=ylabel1, secondary_y=True)
-        fig.update_yaxes(title_text=ylabel2, secondary_y=False)
-        fig.show()
+    Parameters
+    ----------
+    transaction_log: :obj: DataFrame
+        a Pandas DataFrame that contains your transaction log, or a CustomerIndex or CohortState
+        built from it.
+    datetime_col: string
+        the column in transaction_log DataFrame that denotes the datetime of an order.
+    customerid_col: string
+        the column in transaction_log DataFrame that contains the unique customer_id.
+    freq: string, optional
+        the period to bucket orders by; one of 'D', 'W', 'M', 'Q' or 'Y'.
+    approx: boolean, optional
+        estimate unique customers with HyperLogLog sketches (see customer_sketch) instead
+        of counting them exactly.
+    error: float, optional
+        the relative standard error of the estimates when approx is True.
+    n_jobs: int, optional
+        the number of worker processes to split the work across, each taking the orders
+        of a share of the customers; -1 uses every CPU. Only applies to a DataFrame.
+    start: datetime-like, optional
+        only count orders placed at or after start. Cohorts and first orders still come
+        from the whole log.
+    end: datetime-like, optional
+        only count orders placed before end.
+    customers: list-like, optional
+        only count the orders of these customer ids.
+    -------
+    :obj: DataFrame
+        the share of each cohort (columns) purchasing in its n-th period on site (rows,
+        starting at 1).
+    """
+    transaction_log = _select(transaction_log, datetime_col, customerid_col,
+                              None, start, end, customers)
+
+    if isinstance(transaction_log, CohortState):
+        cohorts = transaction_log.user_counts(freq).to_frame()
+    elif approx:
+        cohorts = customer_sketch(transaction_log,
+                                  datetime_col,
+                                  customerid_col,
+                                  by='cohort',
+                                  freq=freq,
+                                  error=error).estimate().round()
+        cohorts = cohorts.rename_axis(['CohortGroup', 'OrderPeriod']).to_frame(
+            'TotalUsers')
     else:
-        fig = px.bar(df,
-                     x=df.index,
-                     y=df[ordervalue_col],
-                     labels={
-                         ordervalue_col: ylabel2,
-                         'x': 'Month-Year'
-                     })
-        fig.update_layout(yaxis=dict(tickformat='$,'), title_text=title)
-        fig.update_traces(marker_color='#08A05C')
-        fig.add_trace
-        fig.show()
+        # Count unique users by the cohort group of each order's user and its order period
+        first, arrays = _cohort_data(transaction_log, datetime_col,
+                                     customerid_col, None, freq, ['users'],
+                                     n_jobs)
+        cohorts = _nonzero_cells(arrays['users'], first).to_frame()
+
+    # A cohort's n-th period on site is its order period code less its cohort code,
+    # plus one; periods are consecutive codes, so a month without orders keeps its age
+    with _stage('pivot', len(cohorts)) as stage:
+        users = cohorts['TotalUsers'].to_numpy(dtype=np.float64)
+        cohort_codes = cohorts.index.get_level_values(0).to_numpy(dtype=np.int64)
+        order_codes = cohorts.index.get_level_values(1).to_numpy(dtype=np.int64)
+        last = order_codes.max() if len(order_codes) else 0
+
+        # Cohorts acquired before a start filter have no first period to measure by
+        sized = np.isin(cohort_codes, cohort_codes[order_codes == cohort_codes])
+        users = users[sized]
+        cohort_codes = cohort_codes[sized]
+        order_codes = order_codes[sized]
+
+        groups, columns = np.unique(cohort_codes, return_inverse=True)
+        ages = order_codes - cohort_codes
+        matrix = np.full((ages.max() + 1 if len(ages) else 0, len(groups)),
+                         np.nan)
+        matrix[ages, columns] = users
+
+        # Within the observed periods, a cohort with no buyers in a period retained
+        # none of them; only periods after the last order are unknown
+        observed = (last - groups >= np.arange(len(matrix))[:, None])
+        matrix[observed & np.isnan(matrix)] = 0
+
+        # Divide by the size of each cohort, its number of users in its first period
+        user_retention = pd.DataFrame(matrix / matrix[:1],
+                                      index=pd.RangeIndex(1,
+                                                          len(matrix) + 1,
+                                                          name='CohortPeriod'),
+                                      columns=_period_labels(groups,
+                                                             freq,
+                                                             name='CohortGroup'))
+        stage.rows_out = len(user_retention)
+    return user_retention
 
 
 def cohort_retention_chart(transaction_log,
                            datetime_col,
                            ordervalue_col,
                            customerid_col,
-                           cohort1,
-                           cohort2,
-                           cohort3,
+                           *cohorts,
                            title='Cohorts: User Retention',
-                           ylabel="Percent of Cohort Purchasing"):
+                           ylabel="Percent of Cohort Purchasing",
+                           max_age=12,
+                           freq='M',
+                           approx=False,
+                           error=0.02,
+                           n_jobs=None,
+                           start=None,
+                           end=None,
+                           customers=None,
+                           show=True):
     """
-    Creates a bar chart of monthly revenue. 
+    Creates a line chart of the share of each cohort still purchasing, by months since first purchase.
     
     Parameters
     ----------
     transaction_log: :obj: DataFrame
-        a Pandas DataFrame that contains your transaction log.
+        a Pandas DataFrame that contains your transaction log, or a CustomerIndex or CohortState
+        built from it.
     datetime_col: string
         the column in transaction_log DataFrame that denotes the datetime of an order.
     ordervalue_col: string
         the column in transaction_log DataFrame that contains the total value of an order.
     customerid_col: string
         the column in transaction_log DataFrame that contains the unique customer_id.
-    cohort1: string
-        the cohort in 'YYYY-MM' format whose monthly retention you want plotted.
-    cohort2: string
-        the cohort in 'YYYY-MM' format whose monthly retention you want plotted.
-    cohort3: string
-        the cohort in 'YYYY-MM' format whose montly retention you want plotted.
+    *cohorts: string
+        the cohorts in 'YYYY-MM' format whose monthly retention you want plotted, as
+        many as you like. By default, every cohort.
     title: string, optional
         the title of the plot.
     ylabel: string, optional
         the label for the y-axis of the plot.
+    max_age: int, optional
+        the last period on site shown on the x-axis; None shows every period.
+    freq: string, optional
+        the period to bucket orders by; one of 'D', 'W', 'M', 'Q' or 'Y'.
+        cohorts are then labelled like 'YYYY-MM-DD', 'YYYY-MM', 'Q1 2020' or 'YYYY'.
+    approx: boolean, optional
+        estimate unique customers with HyperLogLog sketches (see customer_sketch) instead
+        of counting them exactly.
+    error: float, optional
+        the relative standard error of the estimates when approx is True.
+    n_jobs: int, optional
+        the number of worker processes to split the work across, each taking the orders
+        of a share of the customers; -1 uses every CPU. Only applies to a DataFrame.
+    start: datetime-like, optional
+        only count orders placed at or after start. Cohorts and first orders still come
+        from the whole log.
+    end: datetime-like, optional
+        only count orders placed before end.
+    customers: list-like, optional
+        only count the orders of these customer ids.
+    show: boolean, optional
+        display the chart. Pass False to only build and return it, e.g. for save_charts;
+        it is then neither opened in a viewer nor drawn through pyplot.
     -------
     axes: matplotlib.AxesSubplot
     """
-    # Define a monthly order period
-    transaction_log['OrderPeriod'] = transaction_log[datetime_col].apply(
-        lambda x: x.strftime('%Y-%m'))
-    transaction_log.set_index(customerid_col, inplace=True)
-
-    # Define the cohort group of a user
-    transaction_log['CohortGroup'] = transaction_log.groupby(
-        level=0)[datetime_col].min().apply(lambda x: x.strftime('%Y-%m'))
-    transaction_log.reset_index(inplace=True)
-
-    # Aggregate data based on cohort and monthly order period
-    grouped = transaction_log.groupby(['CohortGroup', 'OrderPeriod'])
-    cohorts = grouped.agg({
-        customerid_col: pd.Series.nunique,
-        ordervalue_col: np.sum
-    })
-    cohorts.rename(columns={customerid_col: 'TotalUsers'}, inplace=True)
-
-    # Create a cohort period column, which reflects number of months on site. Month of first purchase = 1
-    def cohort_period(df):
-        df['CohortPeriod'] = np.arange(len(df)) + 1
-        return df
-
-    cohorts = cohorts.groupby(level=0).apply(cohort_period)
-
-    # reindex the DataFrame
-    cohorts.reset_index(inplace=True)
-    cohorts.set_index(['CohortGroup', 'CohortPeriod'], inplace=True)
+    user_retention = cohort_retention_matrix(transaction_log,
+                                             datetime_col,
+                                             customerid_col,
+                                             freq=freq,
+                                             approx=approx,
+                                             error=error,
+                                             n_jobs=n_jobs,
+                                             start=start,
+                                             end=end,
+                                             customers=customers)
+
+    return _draw_retention(user_retention, cohorts, title, ylabel, max_age,
+                           show)
+
+
+@_cached('datetime_col', 'customerid_col', 'segment_col')
+def new_customers_table(transaction_log,
+                        datetime_col,
+                        customerid_col,
+                        freq='M',
+                        start=None,
+                        end=None,
+                        customers=None,
+                        segment_col=None):
+    """
+    Computes the number of new buyers by month of first purchase, as plotted by new_customers_chart.
 
-    # create a Series holding the total size of each CohortGroup
-    cohort_group_size = cohorts['TotalUsers'].groupby(level=0).first()
+    Parameters
+    ----------
+    transaction_log: :obj: DataFrame
+        a Pandas DataFrame that contains your transaction log, or a CustomerIndex built from it.
+    datetime_col: string
+        the column in transaction_log DataFrame that denotes the datetime of an order.
+    customerid_col: string
+        the column in transaction_log DataFrame that contains the unique customer_id.
+    freq: string, optional
+        the period to bucket orders by; one of 'D', 'W', 'M', 'Q' or 'Y'.
+    start: datetime-like, optional
+        only count orders placed at or after start. Cohorts and first orders still come
+        from the whole log.
+    end: datetime-like, optional
+        only count orders placed before end.
+    customers: list-like, optional
+        only count the orders of these customer ids.
+    segment_col: string, optional
+        a column in transaction_log DataFrame that assigns each order to a segment, such
+        as a region or channel. The table is then computed for every segment in one pass
+        and indexed by segment first.
+    -------
+    :obj: DataFrame
+        the number of new buyers ('TotalUsers') indexed by cohort ('CohortGroup').
+    """
+    frame = transaction_log
+    transaction_log = _select(transaction_log, datetime_col, customerid_col,
+                              None, start, end, customers)
 
-    #User Retention Matrix
-    user_retention = cohorts['TotalUsers'].unstack(0).divide(cohort_group_size,
-                                                             axis=1)
+    if segment_col is not None:
+        index = _customer_index(transaction_log, datetime_col, customerid_col)
+        return _segmented_new_customers(frame, index, segment_col, freq)
 
-    #Plot it
-    user_retention[[cohort1, cohort2, cohort3]].plot(figsize=(10, 5))
-    plt.title(title)
-    plt.xticks(np.arange(1, 12.1, 1))
-    plt.xlim(1, 12)
-    plt.ylabel(ylabel)
+    # Find which cohort a user belongs to. The cohort represents when they made their first purchase.
+    index = _customer_index(transaction_log, datetime_col, customerid_col)
+
+    # Count number of customers in each cohort; these are the new buyers. A selection
+    # only holds the first orders of the customers it acquired.
+    cohorts = index.cohort_codes(freq)
+    if index._source is not None:
+        cohorts = cohorts[index.codes[index.first_order]]
+    with _stage('aggregate', len(cohorts)) as stage:
+        cohort_periods, new_buyers = np.unique(cohorts, return_counts=True)
+        stage.rows_out = len(new_buyers)
+    return pd.DataFrame({'TotalUsers': new_buyers},
+                        index=_period_labels(cohort_periods,
+                                             freq,
+                                             name='CohortGroup'))
 
 
 def new_customers_chart(transaction_log,
@@ -226,14 +2511,21 @@ def new_customers_chart(transaction_log,
                         customerid_col,
                         title='New Buyers by Month',
                         xlabel='Month of First Purchase',
-                        ylabel='Number of New Buyers'):
+                        ylabel='Number of New Buyers',
+                        freq='M',
+                        start=None,
+                        end=None,
+                        customers=None,
+                        segment_col=None,
+                        segment=None,
+                        show=True):
     """
     Creates a bar chart of new buyers by month. 
     
     Parameters
     ----------
     transaction_log: :obj: DataFrame
-        a Pandas DataFrame that contains your transaction log.
+        a Pandas DataFrame that contains your transaction log, or a CustomerIndex built from it.
     datetime_col: string
         the column in transaction_log DataFrame that denotes the datetime of an order.
     customerid_col: string
@@ -244,36 +2536,103 @@ def new_customers_chart(transaction_log,
         the label for the x-axis of the plot.
     ylabel: string, optional
         the label for the y-axis of the plot.
+    freq: string, optional
+        the period to bucket orders by; one of 'D', 'W', 'M', 'Q' or 'Y'.
+    start: datetime-like, optional
+        only count orders placed at or after start. Cohorts and first orders still come
+        from the whole log.
+    end: datetime-like, optional
+        only count orders placed before end.
+    customers: list-like, optional
+        only count the orders of these customer ids.
+    segment_col: string, optional
+        a column in transaction_log DataFrame that assigns each order to a segment, such
+        as a region or channel. The chart is then drawn for one segment.
+    segment: optional
+        the segment to draw, when segment_col is given. With enable_cache, drawing every
+        segment in turn computes the table of all segments only once.
+    show: boolean, optional
+        display the chart. Pass False to only build and return it, e.g. for save_charts;
+        it is then neither opened in a viewer nor drawn through pyplot.
     -------
-    axes: matplotlib.AxesSubplot
+    fig: plotly.graph_objects.Figure
+    """
+    cohorts = new_customers_table(transaction_log,
+                                  datetime_col,
+                                  customerid_col,
+                                  freq=freq,
+                                  start=start,
+                                  end=end,
+                                  customers=customers,
+                                  segment_col=segment_col)
+    if segment_col is not None:
+        cohorts = cohorts.loc[segment]
+
+    return _draw_new_customers(cohorts, title, xlabel, ylabel, show)
+
+
+@_cached('datetime_col', 'customerid_col', 'ordervalue_col', 'segment_col')
+def customer_type_revenue_table(transaction_log,
+                                datetime_col,
+                                customerid_col,
+                                ordervalue_col,
+                                freq='M',
+                                n_jobs=None,
+                                start=None,
+                                end=None,
+                                customers=None,
+                                segment_col=None):
     """
+    Computes revenue by buyer type per month, as plotted by customer_type_revenue_mix.
+    Note: only a new buyer's first purchase counts towards new buyer revenue.
 
-    # Find which cohort a user belongs to. The cohort represents when they made their first purchase.
-    transaction_log.set_index(customerid_col, inplace=True)
-    transaction_log['CohortGroup'] = transaction_log.groupby(
-        level=0)[datetime_col].min().apply(lambda x: x.strftime('%Y-%m'))
-    transaction_log.reset_index(inplace=True)
-
-    # Count number of unique customers in each cohort.
-    grouped = transaction_log.groupby(['CohortGroup'])
-    cohorts = grouped.agg({customerid_col: pd.Series.nunique})
-
-    # Number of unique customer in each cohort represents the new buyers.
-    cohorts.rename(columns={customerid_col: 'TotalUsers'}, inplace=True)
-    cohorts.reset_index(inplace=True)
-    cohorts.set_index(['CohortGroup'], inplace=True)
-
-    # Plot it
-    fig = px.bar(cohorts,
-                 x=cohorts.index,
-                 y='TotalUsers',
-                 title=title,
-                 labels={
-                     'TotalUsers': ylabel,
-                     'x': xlabel
-                 })
-    fig.update_traces(marker_color='#08A05C')
-    fig.show()
+    Parameters
+    ----------
+    transaction_log: :obj: DataFrame
+        a Pandas DataFrame that contains your transaction log, or a CustomerIndex built from it.
+    datetime_col: string
+        the column in transaction_log DataFrame that denotes the datetime of an order.
+    customerid_col: string
+        the column in transaction_log DataFrame that contains the unique customer_id.
+    ordervalue_col: string
+        the column in transaction_log DataFrame that contains the total value of an order.
+    freq: string, optional
+        the period to bucket orders by; one of 'D', 'W', 'M', 'Q' or 'Y'.
+    n_jobs: int, optional
+        the number of worker processes to split the work across, each taking the orders
+        of a share of the customers; -1 uses every CPU. Only applies to a DataFrame.
+    start: datetime-like, optional
+        only count orders placed at or after start. Cohorts and first orders still come
+        from the whole log.
+    end: datetime-like, optional
+        only count orders placed before end.
+    customers: list-like, optional
+        only count the orders of these customer ids.
+    segment_col: string, optional
+        a column in transaction_log DataFrame that assigns each order to a segment, such
+        as a region or channel. The table is then computed for every segment in one pass
+        and indexed by segment first.
+    -------
+    :obj: DataFrame
+        'InitialBuyers' and 'RepeatBuyers' revenue indexed by period ('OrderPeriod').
+        Periods without orders are left out; a buyer type missing from a period is 0.
+    """
+    frame = transaction_log
+    transaction_log = _select(transaction_log, datetime_col, customerid_col,
+                              ordervalue_col, start, end, customers)
+
+    if segment_col is not None:
+        index = _customer_index(transaction_log, datetime_col, customerid_col,
+                                ordervalue_col)
+        return _segmented_buyer_types(frame, index, segment_col, freq,
+                                      'type_revenue')
+
+    #Aggregate Initial Buyer and Repeat Buyer orders by period, from each buyer's first order in time
+    first, arrays = _cohort_data(transaction_log, datetime_col, customerid_col,
+                                 ordervalue_col, freq,
+                                 ['type_orders', 'type_revenue'], n_jobs)
+    return _buyer_type_frame(arrays['type_revenue'],
+                             arrays['type_orders'].sum(axis=0), first, freq)
 
 
 def customer_type_revenue_mix(transaction_log,
@@ -281,7 +2640,15 @@ def customer_type_revenue_mix(transaction_log,
                               customerid_col,
                               ordervalue_col,
                               figsize=(12, 8),
-                              rotation='vertical'):
+                              rotation='vertical',
+                              freq='M',
+                              n_jobs=None,
+                              start=None,
+                              end=None,
+                              customers=None,
+                              segment_col=None,
+                              segment=None,
+                              show=True):
     """
     Creates a stacked bar chart of percent of revenue by buyer type per month.
     Note: only a new buyer's first purchase counts towards new buyer revenue. If
@@ -291,7 +2658,7 @@ def customer_type_revenue_mix(transaction_log,
     Parameters
     ----------
     transaction_log: :obj: DataFrame
-        a Pandas DataFrame that contains your transaction log.
+        a Pandas DataFrame that contains your transaction log, or a CustomerIndex built from it.
     datetime_col: string
         the column in transaction_log DataFrame that denotes the datetime of an order.
     customerid_col: string
@@ -302,96 +2669,118 @@ def customer_type_revenue_mix(transaction_log,
         the size of the chart.
     rotation: string, optional
         rotation for x-axis tick marks; may be 'horizontal' or 'vertical'
+    freq: string, optional
+        the period to bucket orders by; one of 'D', 'W', 'M', 'Q' or 'Y'.
+    n_jobs: int, optional
+        the number of worker processes to split the work across, each taking the orders
+        of a share of the customers; -1 uses every CPU. Only applies to a DataFrame.
+    start: datetime-like, optional
+        only count orders placed at or after start. Cohorts and first orders still come
+        from the whole log.
+    end: datetime-like, optional
+        only count orders placed before end.
+    customers: list-like, optional
+        only count the orders of these customer ids.
+    segment_col: string, optional
+        a column in transaction_log DataFrame that assigns each order to a segment, such
+        as a region or channel. The chart is then drawn for one segment.
+    segment: optional
+        the segment to draw, when segment_col is given. With enable_cache, drawing every
+        segment in turn computes the table of all segments only once.
+    show: boolean, optional
+        display the chart. Pass False to only build and return it, e.g. for save_charts;
+        it is then neither opened in a viewer nor drawn through pyplot.
     -------
     axes: matplotlib.AxesSubplot
     """
-    # Identify a buyer's first transaction
-    transaction_log.sort_values(datetime_col)
-    transaction_log['NewBuyer'] = (
-        ~transaction_log[customerid_col].duplicated()).astype(int)
-
-    #Create an Initial Buyer DataFrame and Repeat Buyer DataFrame
-    nb = transaction_log.loc[transaction_log['NewBuyer'] == 1]
-    ob = transaction_log.loc[transaction_log['NewBuyer'] == 0]
-
-    #Format New/Repeat Buyer DataFrames correctly
-    nb[datetime_col] = nb[datetime_col].astype(
-        'datetime64[ns]')  # This line causes a SettingWithCopyWarning
-    nb['OrderPeriod'] = nb[datetime_col].apply(lambda x: x.strftime(
-        '%Y-%m'))  # This line causes a SettingWithCopyWarning
-    nb.set_index(customerid_col, inplace=True)
-    grouped = nb.groupby(['OrderPeriod'])
-    cohorts = grouped.agg({
-        ordervalue_col: np.sum,
-    })
-    cohorts.rename(columns={ordervalue_col: 'TotalOrderValue'}, inplace=True)
-
-    ob[datetime_col] = ob[datetime_col].astype(
-        'datetime64[ns]')  # This line causes a SettingWithCopyWarning
-    ob['OrderPeriod'] = ob[datetime_col].apply(lambda x: x.strftime(
-        '%Y-%m'))  # This line causes a SettingWithCopyWarning
-    ob.set_index(customerid_col, inplace=True)
-    grouped2 = ob.groupby(['OrderPeriod'])
-    cohorts2 = grouped2.agg({
-        ordervalue_col: np.sum,
-    })
-    cohorts2.rename(columns={ordervalue_col: 'TotalOrderValue'}, inplace=True)
-
-    # Format Axis Data for Plot
-    cohorts.reset_index(inplace=True)
-    cohorts.set_index('OrderPeriod', inplace=True)
-    months = cohorts.index.to_numpy()
-    r = []
-    i = -1
-    for x in months:
-        i += 1
-        r.append(i)
-
-    # Get Data for Plot
-    raw_data = {
-        'InitialBuyers': cohorts['TotalOrderValue'],
-        'RepeatBuyers': cohorts2['TotalOrderValue']
-    }
-    df = pd.DataFrame(raw_data)
-
-    # Get Totals
-    totals = [i + j for i, j in zip(df['InitialBuyers'], df['RepeatBuyers'])]
-    greenBars = [i / j * 100 for i, j in zip(df['InitialBuyers'], totals)]
-    orangeBars = [i / j * 100 for i, j in zip(df['RepeatBuyers'], totals)]
-
-    # Plot Dimensions
-    barWidth = 0.85
-    plt.rcParams["figure.figsize"] = figsize
-
-    # Create Initial Buyer Bars
-    plt.bar(r,
-            greenBars,
-            color='#08A05C',
-            edgecolor='white',
-            width=barWidth,
-            label='New Buyers')
-
-    # Create Repeat Buyer Bars
-    plt.bar(r,
-            orangeBars,
-            bottom=greenBars,
-            color='#f9bc86',
-            edgecolor='white',
-            width=barWidth,
-            label='Repeat Buyers')
-
-    # Labels and Legend
-    plt.xticks(r, months, rotation=rotation)
-    plt.ylabel('Percent of Monthly Revenue')
-    plt.legend(loc='upper left', bbox_to_anchor=(1, 1), ncol=1)
-    plt.show()
+    df = customer_type_revenue_table(transaction_log,
+                                     datetime_col,
+                                     customerid_col,
+                                     ordervalue_col,
+                                     freq=freq,
+                                     n_jobs=n_jobs,
+                                     start=start,
+                                     end=end,
+                                     customers=customers,
+                                     segment_col=segment_col)
+    if segment_col is not None:
+        df = df.loc[segment]
+    return _buyer_type_bars(df, figsize, rotation, 'Percent of Monthly Revenue',
+                            show)
+
+
+@_cached('datetime_col', 'customerid_col', 'segment_col')
+def customer_type_count_table(transaction_log,
+                              datetime_col,
+                              customerid_col,
+                              freq='M',
+                              n_jobs=None,
+                              start=None,
+                              end=None,
+                              customers=None,
+                              segment_col=None):
+    """
+    Computes the number of customers by buyer type per month, as plotted by customer_type_count.
+    Note: only a new buyer's first purchase counts towards new buyer.
+
+    Parameters
+    ----------
+    transaction_log: :obj: DataFrame
+        a Pandas DataFrame that contains your transaction log, or a CustomerIndex built from it.
+    datetime_col: string
+        the column in transaction_log DataFrame that denotes the datetime of an order.
+    customerid_col: string
+        the column in transaction_log DataFrame that contains the unique customer_id.
+    freq: string, optional
+        the period to bucket orders by; one of 'D', 'W', 'M', 'Q' or 'Y'.
+    n_jobs: int, optional
+        the number of worker processes to split the work across, each taking the orders
+        of a share of the customers; -1 uses every CPU. Only applies to a DataFrame.
+    start: datetime-like, optional
+        only count orders placed at or after start. Cohorts and first orders still come
+        from the whole log.
+    end: datetime-like, optional
+        only count orders placed before end.
+    customers: list-like, optional
+        only count the orders of these customer ids.
+    segment_col: string, optional
+        a column in transaction_log DataFrame that assigns each order to a segment, such
+        as a region or channel. The table is then computed for every segment in one pass
+        and indexed by segment first.
+    -------
+    :obj: DataFrame
+        'InitialBuyers' and 'RepeatBuyers' customer counts indexed by period ('OrderPeriod').
+        Periods without orders are left out; a buyer type missing from a period is 0.
+    """
+    frame = transaction_log
+    transaction_log = _select(transaction_log, datetime_col, customerid_col,
+                              None, start, end, customers)
+
+    if segment_col is not None:
+        index = _customer_index(transaction_log, datetime_col, customerid_col)
+        return _segmented_buyer_types(frame, index, segment_col, freq,
+                                      'type_users')
+
+    #Count Initial Buyers and Repeat Buyers by period, from each buyer's first order in time
+    first, arrays = _cohort_data(transaction_log, datetime_col, customerid_col,
+                                 None, freq, ['type_users'], n_jobs)
+    users = arrays['type_users']
+    return _buyer_type_frame(users, users.sum(axis=0), first, freq)
 
 
 def customer_type_count(transaction_log,
                         datetime_col,
                         customerid_col,
                         figsize=(12, 8),
-                        rotation='vertical'):
+                        rotation='vertical',
+                        freq='M',
+                        n_jobs=None,
+                        start=None,
+                        end=None,
+                        customers=None,
+                        segment_col=None,
+                        segment=None,
+                        show=True):
     """
     Creates a stacked bar chart of percent of buyer types per month
     Note: only a new buyer's first purchase counts towards new buyer. If
@@ -401,7 +2790,7 @@ def customer_type_count(transaction_log,
     Parameters
     ----------
     transaction_log: :obj: DataFrame
-        a Pandas DataFrame that contains your transaction log.
+        a Pandas DataFrame that contains your transaction log, or a CustomerIndex built from it.
     datetime_col: string
         the column in transaction_log DataFrame that denotes the datetime of an order.
     customerid_col: string
@@ -412,92 +2801,56 @@ def customer_type_count(transaction_log,
         the size of the chart.
     rotation: string, optional
         rotation for x-axis tick marks; may be 'horizontal' or 'vertical'
+    freq: string, optional
+        the period to bucket orders by; one of 'D', 'W', 'M', 'Q' or 'Y'.
+    n_jobs: int, optional
+        the number of worker processes to split the work across, each taking the orders
+        of a share of the customers; -1 uses every CPU. Only applies to a DataFrame.
+    start: datetime-like, optional
+        only count orders placed at or after start. Cohorts and first orders still come
+        from the whole log.
+    end: datetime-like, optional
+        only count orders placed before end.
+    customers: list-like, optional
+        only count the orders of these customer ids.
+    segment_col: string, optional
+        a column in transaction_log DataFrame that assigns each order to a segment, such
+        as a region or channel. The chart is then drawn for one segment.
+    segment: optional
+        the segment to draw, when segment_col is given. With enable_cache, drawing every
+        segment in turn computes the table of all segments only once.
+    show: boolean, optional
+        display the chart. Pass False to only build and return it, e.g. for save_charts;
+        it is then neither opened in a viewer nor drawn through pyplot.
     -------
     axes: matplotlib.AxesSubplot
     """
-    # Identify a buyer's first transaction
-    transaction_log.sort_values(datetime_col)
-    transaction_log['NewBuyer'] = (
-        ~transaction_log[customerid_col].duplicated()).astype(int)
-
-    #Create an Initial Buyer DataFrame and Repeat Buyer DataFrame
-    nb = transaction_log.loc[transaction_log['NewBuyer'] == 1]
-    ob = transaction_log.loc[transaction_log['NewBuyer'] == 0]
-
-    #Format New/Repeat Buyer DataFrames correctly
-    nb[datetime_col] = nb[datetime_col].astype(
-        'datetime64[ns]')  # This line causes a SettingWithCopyWarning
-    nb['OrderPeriod'] = nb[datetime_col].apply(lambda x: x.strftime(
-        '%Y-%m'))  # This line causes a SettingWithCopyWarning
-    nb.set_index(datetime_col, inplace=True)
-    grouped = nb.groupby(['OrderPeriod'])
-    cohorts = grouped.agg({customerid_col: pd.Series.nunique})
-    cohorts.rename(columns={customerid_col: 'CustomerCount'}, inplace=True)
-
-    ob[datetime_col] = ob[datetime_col].astype(
-        'datetime64[ns]')  # This line causes a SettingWithCopyWarning
-    ob['OrderPeriod'] = ob[datetime_col].apply(lambda x: x.strftime(
-        '%Y-%m'))  # This line causes a SettingWithCopyWarning
-    ob.set_index(datetime_col, inplace=True)
-    grouped2 = ob.groupby(['OrderPeriod'])
-    cohorts2 = grouped2.agg({customerid_col: pd.Series.nunique})
-    cohorts2.rename(columns={customerid_col: 'CustomerCount'}, inplace=True)
-
-    # Format Axis Data for Plot
-    cohorts.reset_index(inplace=True)
-    cohorts.set_index('OrderPeriod', inplace=True)
-    months = cohorts.index.to_numpy()
-    r = []
-    i = -1
-    for x in months:
-        i += 1
-        r.append(i)
-
-    # Get Data for Plot
-    raw_data = {
-        'InitialBuyers': cohorts['CustomerCount'],
-        'RepeatBuyers': cohorts2['CustomerCount']
-    }
-    df = pd.DataFrame(raw_data)
-
-    # Get Totals
-    totals = [i + j for i, j in zip(df['InitialBuyers'], df['RepeatBuyers'])]
-    greenBars = [i / j * 100 for i, j in zip(df['InitialBuyers'], totals)]
-    orangeBars = [i / j * 100 for i, j in zip(df['RepeatBuyers'], totals)]
-
-    # Plot Dimensions
-    barWidth = 0.85
-    plt.rcParams["figure.figsize"] = figsize
-
-    # Create Initial Buyer Bars
-    plt.bar(r,
-            greenBars,
-            color='#08A05C',
-            edgecolor='white',
-            width=barWidth,
-            label='New Buyers')
-
-    # Create Repeat Buyer Bars
-    plt.bar(r,
-            orangeBars,
-            bottom=greenBars,
-            color='#f9bc86',
-            edgecolor='white',
-            width=barWidth,
-            label='Repeat Buyers')
-
-    # Labels and Legend
-    plt.xticks(r, months, rotation=rotation)
-    plt.ylabel('Count of Customers')
-    plt.legend(loc='upper left', bbox_to_anchor=(1, 1), ncol=1)
-    plt.show()
+    df = customer_type_count_table(transaction_log,
+                                   datetime_col,
+                                   customerid_col,
+                                   freq=freq,
+                                   n_jobs=n_jobs,
+                                   start=start,
+                                   end=end,
+                                   customers=customers,
+                                   segment_col=segment_col)
+    if segment_col is not None:
+        df = df.loc[segment]
+    return _buyer_type_bars(df, figsize, rotation, 'Count of Customers',
+                            show)
 
 
 def c3_chart(transaction_log,
              customer_id,
              datetime_col,
              ordervalue_col,
-             title="Total Quarterly Sales by Acquisition Cohort Over Time"):
+             title="Total Quarterly Sales by Acquisition Cohort Over Time",
+             freq='Q',
+             n_jobs=None,
+             start=None,
+             end=None,
+             customers=None,
+             show=True):
     """
     Creates a stacked area chart of revenue from acquisition cohort by time. Grouped and aggregated by
     quarter.
@@ -505,7 +2858,8 @@ def c3_chart(transaction_log,
     Parameters
     ----------
     transaction_log: :obj: DataFrame
-        a Pandas DataFrame that contains your transaction log.
+        a Pandas DataFrame that contains your transaction log, or a CustomerIndex or CohortState
+        built from it.
     datetime_col: string
         the column in transaction_log DataFrame that denotes the datetime of an order.
     customerid_col: string
@@ -516,96 +2870,1153 @@ def c3_chart(transaction_log,
         the size of the chart.
     rotation: string, optional
         rotation for x-axis tick marks; may be 'horizontal' or 'vertical'
+    freq: string, optional
+        the period to bucket orders by; one of 'D', 'W', 'M', 'Q' or 'Y'.
+    n_jobs: int, optional
+        the number of worker processes to split the work across, each taking the orders
+        of a share of the customers; -1 uses every CPU. Only applies to a DataFrame.
+    start: datetime-like, optional
+        only count orders placed at or after start. Cohorts and first orders still come
+        from the whole log.
+    end: datetime-like, optional
+        only count orders placed before end.
+    customers: list-like, optional
+        only count the orders of these customer ids.
+    show: boolean, optional
+        display the chart. Pass False to only build and return it, e.g. for save_charts;
+        it is then neither opened in a viewer nor drawn through pyplot.
     -------
-    axes: matplotlib.AxesSubplot
+    fig: plotly.graph_objects.Figure
     """
+    cohort_pivot = c3_pivot(transaction_log,
+                            customer_id,
+                            datetime_col,
+                            ordervalue_col,
+                            freq=freq,
+                            n_jobs=n_jobs,
+                            start=start,
+                            end=end,
+                            customers=customers)
 
-    # throw away all unwanted data
-    transaction_log = transaction_log[[
-        customer_id, datetime_col, ordervalue_col
-    ]]
-    #convert the date string to datetime object
-    transaction_log[datetime_col] = pd.to_datetime(
-        transaction_log[datetime_col])
-
-    # copy the part of the original data into a pivot table to compute the min of order date
-    # based on the customer id
-    pivot1 = transaction_log.pivot_table(index=customer_id,
-                                         values=datetime_col,
-                                         aggfunc='min')
-    # rename the column order date to birthday (the first day of purchase)
-    pivot1 = pivot1.rename(columns={datetime_col: "birthday"})
-    # make that into datetime just in case
-    pivot1['birthday'] = pd.to_datetime(pivot1['birthday'])
-
-    # merge computed data with original data
-    merged = pd.merge(transaction_log, pivot1, on=customer_id, how='right')
-    # turn the new dates and old dates into quaters for financial years
-    merged[datetime_col] = pd.PeriodIndex(merged[datetime_col], freq='Q')
-    merged['birthday'] = pd.PeriodIndex(merged['birthday'], freq='Q')
-
-    # make final pivot table to place the first dates quaters against the order dates quaters
-    cohort_pivot = merged.pivot_table(index='birthday',
-                                      columns=datetime_col,
-                                      values=ordervalue_col,
-                                      aggfunc='sum')
-
-    # change the datetime.Period objects to string object to be plotted
-    def quarterToString(cell):
-        return cell.strftime('Q%q %Y')
-
-    cohort_pivot.columns = cohort_pivot.columns.map(quarterToString)
-    cohort_pivot.index = cohort_pivot.index.map(quarterToString)
-    cohort_pivot.reindex()
-
-    fig = go.Figure(layout={"title": title})
-    for i in range(len(cohort_pivot.columns)):
-        fig.add_trace(
-            go.Scatter(name=cohort_pivot.columns.values[i],
-                       x=cohort_pivot.index,
-                       y=cohort_pivot.iloc[i, :],
-                       stackgroup='one',
-                       fill='tonexty',
-                       mode='none'))
-
-    fig.show()
-
-
-def c3_pivot(transaction_log, customer_id, datetime_col, ordervalue_col):
-    # throw away all unwanted data
-    transaction_log = transaction_log[[
-        customer_id, datetime_col, ordervalue_col
-    ]]
-    #convert the date string to datetime object
-    transaction_log[datetime_col] = pd.to_datetime(
-        transaction_log[datetime_col])
-
-    # copy the part of the original data into a pivot table to compute the min of order date
-    # based on the customer id
-    pivot1 = transaction_log.pivot_table(index=customer_id,
-                                         values=datetime_col,
-                                         aggfunc='min')
-    # rename the column order date to birthday (the first day of purchase)
-    pivot1 = pivot1.rename(columns={datetime_col: "birthday"})
-    # make that into datetime just in case
-    pivot1['birthday'] = pd.to_datetime(pivot1['birthday'])
-
-    # merge computed data with original data
-    merged = pd.merge(transaction_log, pivot1, on=customer_id, how='right')
-    # turn the new dates and old dates into quaters for financial years
-    merged[datetime_col] = pd.PeriodIndex(merged[datetime_col], freq='Q')
-    merged['birthday'] = pd.PeriodIndex(merged['birthday'], freq='Q')
-
-    # make final pivot table to place the first dates quaters against the order dates quaters
-    cohort_pivot = merged.pivot_table(index='birthday',
-                                      columns=datetime_col,
-                                      values=ordervalue_col,
-                                      aggfunc='sum')
-
-    # change the datetime.Period objects to string object to be plotted
-    def quarterToString(cell):
-        return cell.strftime('Q%q %Y')
-
-    cohort_pivot.columns = cohort_pivot.columns.map(quarterToString)
-    cohort_pivot.index = cohort_pivot.index.map(quarterToString)
-    return cohort_pivot.reindex()
+    return _draw_c3(cohort_pivot, title, show)
+
+
+@_cached('customer_id', 'datetime_col', 'ordervalue_col')
+def c3_pivot(transaction_log,
+             customer_id,
+             datetime_col,
+             ordervalue_col,
+             freq='Q',
+             n_jobs=None,
+             start=None,
+             end=None,
+             customers=None):
+    """
+    Creates a pivot table of revenue by acquisition cohort (rows) and order period (columns),
+    quarterly by default. This is the table plotted by c3_chart.
+
+    Parameters
+    ----------
+    transaction_log: :obj: DataFrame
+        a Pandas DataFrame that contains your transaction log, or a CustomerIndex or CohortState
+        built from it.
+    customer_id: string
+        the column in transaction_log DataFrame that contains the unique customer_id.
+    datetime_col: string
+        the column in transaction_log DataFrame that denotes the datetime of an order.
+    ordervalue_col: string
+        the column in transaction_log DataFrame that contains the total value of an order.
+    freq: string, optional
+        the period to bucket orders by; one of 'D', 'W', 'M', 'Q' or 'Y'.
+    n_jobs: int, optional
+        the number of worker processes to split the work across, each taking the orders
+        of a share of the customers; -1 uses every CPU. Only applies to a DataFrame.
+    start: datetime-like, optional
+        only count orders placed at or after start. Cohorts and first orders still come
+        from the whole log.
+    end: datetime-like, optional
+        only count orders placed before end.
+    customers: list-like, optional
+        only count the orders of these customer ids.
+    -------
+    :obj: DataFrame
+    """
+    transaction_log = _select(transaction_log, datetime_col, customer_id,
+                              ordervalue_col, start, end, customers)
+
+    if isinstance(transaction_log, CohortState):
+        cohort_pivot = transaction_log.revenue_matrix(freq)
+    else:
+        # accumulate revenue in a dense matrix of each customer's first order (birthday)
+        # period against the order period
+        first, arrays = _cohort_data(transaction_log, datetime_col, customer_id,
+                                     ordervalue_col, freq,
+                                     ['orders', 'revenue'], n_jobs)
+        cohort_pivot = _dense_pivot(arrays['revenue'], arrays['orders'], first)
+
+    # label the period codes to be plotted
+    with _stage('pivot', len(cohort_pivot)):
+        cohort_pivot.columns = _period_labels(cohort_pivot.columns,
+                                              freq,
+                                              name=datetime_col)
+        cohort_pivot.index = _period_labels(cohort_pivot.index,
+                                            freq,
+                                            name='birthday')
+    return cohort_pivot
+
+
+def save_charts(charts, directory, format='png'):
+    """
+    Writes charts built with show=False to files, without displaying any of them.
+    Figures are only serialized, so a script or a worker can export many charts in
+    a row without a display, and matplotlib charts are written without going through
+    pyplot.
+
+    Parameters
+    ----------
+    charts: dict
+        the charts by file name (without extension): plotly Figures, or matplotlib
+        Figures or Axes, as returned by the chart functions.
+    directory: string
+        the directory to write to. It is created if needed.
+    format: string, optional
+        'html', or an image format such as 'png', 'svg' or 'pdf'. plotly charts are
+        written to html as one file each, sharing a plotly.min.js in the directory;
+        writing them as images needs the kaleido package. matplotlib charts are
+        written to html as an inline SVG.
+    -------
+    paths: list
+        the paths written, in the order of charts.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    with _stage('render', len(charts)):
+        for name, chart in charts.items():
+            path = os.path.join(directory, '{}.{}'.format(name, format))
+            if hasattr(chart, 'write_html'):
+                # a plotly Figure
+                if format == 'html':
+                    chart.write_html(path, include_plotlyjs='directory')
+                else:
+                    chart.write_image(path, format=format)
+            else:
+                # matplotlib Axes or Figure
+                figure = getattr(chart, 'figure', chart)
+                if format == 'html':
+                    svg = io.StringIO()
+                    figure.savefig(svg, format='svg', bbox_inches='tight')
+                    with open(path, 'w') as f:
+                        f.write('<html><body>\n{}</body></html>\n'.format(
+                            svg.getvalue()))
+                else:
+                    figure.savefig(path, format=format, bbox_inches='tight')
+            paths.append(path)
+    return paths
+
+
+def customer_summary(transaction_log,
+                     datetime_col,
+                     customerid_col,
+                     ordervalue_col=None,
+                     observation_end=None,
+                     unit='D',
+                     chunksize=1000000):
+    """
+    Summarizes each customer's purchase history, for recency, frequency and monetary
+    value (RFM) analyses or lifetime value models.
+
+    Customers are read in one pass over the orders sorted by customer and time, taking
+    at most chunksize orders at a time, so temporary memory stays bounded however many
+    customers there are. First purchases are the same as those the cohort charts use.
+
+    Parameters
+    ----------
+    transaction_log: :obj: DataFrame
+        a Pandas DataFrame that contains your transaction log, or a CustomerIndex built
+        from it.
+    datetime_col: string
+        the column in transaction_log DataFrame that denotes the datetime of an order.
+    customerid_col: string
+        the column in transaction_log DataFrame that contains the unique customer_id.
+    ordervalue_col: string, optional
+        the column in transaction_log DataFrame that contains the total value of an order.
+        Adds the TotalValue and MeanValue columns.
+    observation_end: datetime-like, optional
+        the end of the observation period. Only orders placed before it are counted, and
+        tenure is measured up to it. By default, the time of the last order.
+    unit: string, optional
+        the unit of the durations; one of 'W', 'D', 'h', 'm' or 's'.
+    chunksize: int, optional
+        the number of orders to process at a time.
+    -------
+    :obj: DataFrame
+        one row per customer with any orders, indexed by customer_id, with the columns
+        FirstPurchase, LastPurchase, Orders, RepeatOrders, Recency (from first to last
+        purchase), Tenure (from first purchase to observation_end), MeanGap and MaxGap
+        (between consecutive orders; NaN without repeat orders), and with
+        ordervalue_col, TotalValue and MeanValue.
+    """
+    if unit not in ('W', 'D', 'h', 'm', 's'):
+        raise ValueError(
+            "unit must be one of 'W', 'D', 'h', 'm' or 's', not {!r}".format(unit))
+    index = _customer_index(transaction_log, datetime_col, customerid_col,
+                            ordervalue_col)
+    if observation_end is None:
+        # Without any orders there is no last order, nor any customer to measure
+        # tenure for
+        end = index.dates.max() if len(index) else np.datetime64('NaT', 'ns')
+    else:
+        end = _timestamp(observation_end)
+        index = index.select(end=observation_end)
+
+    # Customer i's orders are positions starts[i] to starts[i + 1] in customer, time
+    # order; a TransactionLog's rows are already in that order
+    starts = index._runs()
+    rows = None if isinstance(index, TransactionLog) else index.order
+    orders = np.diff(starts)
+    times = index.dates.view(np.int64)
+    values = None if ordervalue_col is None else index.require_values()
+
+    with _stage('aggregate', len(index)) as stage:
+        last = np.zeros(index.n_customers, dtype=np.int64)
+        max_gap = np.zeros(index.n_customers, dtype=np.int64)
+        total = np.zeros(index.n_customers)
+        # Chunks of whole customers, of about chunksize orders each
+        cuts = np.unique(
+            np.concatenate([[0],
+                            np.searchsorted(starts,
+                                            np.arange(chunksize, len(index),
+                                                      chunksize)),
+                            [index.n_customers]]))
+        for low, high in zip(cuts[:-1], cuts[1:]):
+            present = np.flatnonzero(orders[low:high]) + low
+            if not len(present):
+                continue
+            span = slice(starts[low], starts[high])
+            block = rows[span] if rows is not None else span
+            local = starts[present] - starts[low]
+            chunk = times[block]
+            gaps = np.diff(chunk, prepend=chunk[:1])
+            gaps[local] = 0
+            max_gap[present] = np.maximum.reduceat(gaps, local)
+            last[present] = chunk[np.append(local[1:], len(chunk)) - 1]
+            if values is not None:
+                total[present] = np.add.reduceat(
+                    values[block].astype(np.float64), local)
+        stage.rows_out = int((orders > 0).sum())
+
+    with _stage('pivot', index.n_customers):
+        present = orders > 0
+        orders = orders[present]
+        first = index.first_purchase[present].view(np.int64)
+        last = last[present]
+        scale = np.timedelta64(1, unit).astype('timedelta64[ns]').astype(
+            np.float64)
+        repeat = orders - 1
+        recency = (last - first) / scale
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_gap = np.where(repeat > 0, recency / repeat, np.nan)
+        summary = pd.DataFrame(
+            {
+                'FirstPurchase': first.view('datetime64[ns]'),
+                'LastPurchase': last.view('datetime64[ns]'),
+                'Orders': orders,
+                'RepeatOrders': repeat,
+                'Recency': recency,
+                'Tenure': (end.astype(np.int64) - first) / scale,
+                'MeanGap': mean_gap,
+                'MaxGap': np.where(repeat > 0, max_gap[present] / scale, np.nan)
+            },
+            index=pd.Index(index.customers[present], name=customerid_col))
+        if values is not None:
+            summary['TotalValue'] = total[present]
+            summary['MeanValue'] = summary['TotalValue'] / orders
+    return summary
+
+
+class CohortState(object):
+    """
+    Cohort aggregates that are kept up to date as new transactions arrive.
+
+    Holds each customer's first purchase and the cohort x period matrices of unique
+    users and revenue. update() folds in a batch of new transactions in time
+    proportional to the batch, rather than recomputing over the whole history.
+    A CohortState can be passed to cohort_retention_chart, c3_chart and c3_pivot in
+    place of the transaction log. Unique users match a full recompute exactly; revenue
+    matches it up to floating-point summation order, since each batch is added in
+    separately.
+
+    Batches must arrive in time order per customer: a customer's new orders may not
+    fall in a period before their latest period already folded in.
+
+    Parameters
+    ----------
+    datetime_col: string
+        the column in the transaction batches that denotes the datetime of an order.
+    customerid_col: string
+        the column in the transaction batches that contains the unique customer_id.
+    ordervalue_col: string
+        the column in the transaction batches that contains the total value of an order.
+    freq: string, optional
+        the period to bucket orders by; one of 'D', 'W', 'M', 'Q' or 'Y'. Revenue can
+        also be read at any coarser freq that whole periods roll up into.
+
+    Attributes
+    ----------
+    first_purchase: :obj: ndarray
+        the datetime64[ns] of each customer's first order, by customer code.
+    last_period: :obj: ndarray
+        the latest period code each customer ordered in, by customer code.
+    origin: int
+        the period code of the first row and column of the matrices.
+    users: :obj: ndarray
+        unique users by cohort (rows) and order period (columns).
+    revenue: :obj: ndarray
+        revenue by cohort (rows) and order period (columns).
+    """
+
+    def __init__(self, datetime_col, customerid_col, ordervalue_col, freq='M'):
+        _period_codes(np.array([], dtype='datetime64[ns]'), freq)
+        self.datetime_col = datetime_col
+        self.customerid_col = customerid_col
+        self.ordervalue_col = ordervalue_col
+        self.freq = freq
+
+        # Customer ids live in a large, rarely rebuilt Index plus a small Index of
+        # recent arrivals, so that lookups reuse the large Index's hash table.
+        self._customers = pd.Index([])
+        self._recent = pd.Index([])
+        # Per-customer arrays are buffers with spare capacity, of which the first
+        # _n entries are in use, so that new customers are appended in place.
+        self._first_purchase = np.array([], dtype='datetime64[ns]')
+        self._last_period = np.array([], dtype=np.int64)
+        self._n = 0
+        self.origin = 0
+        self.users = np.zeros((0, 0), dtype=np.int64)
+        self.revenue = np.zeros((0, 0), dtype=np.float64)
+
+    @classmethod
+    def from_transaction_log(cls,
+                             transaction_log,
+                             datetime_col,
+                             customerid_col,
+                             ordervalue_col,
+                             freq='M'):
+        """
+        Creates a CohortState from a full transaction log.
+        """
+        state = cls(datetime_col, customerid_col, ordervalue_col, freq)
+        return state.update(transaction_log)
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def first_purchase(self):
+        return self._first_purchase[:self._n]
+
+    @property
+    def last_period(self):
+        return self._last_period[:self._n]
+
+    @property
+    def customers(self):
+        if not len(self._recent):
+            return self._customers
+        return self._customers.append(self._recent)
+
+    def _lookup(self, ids):
+        codes = self._customers.get_indexer(ids)
+        if len(self._recent):
+            missing = codes < 0
+            recent = self._recent.get_indexer(ids[missing])
+            codes[missing] = np.where(recent < 0, -1,
+                                      recent + len(self._customers))
+        return codes
+
+    def _add_customers(self, ids):
+        self._recent = ids if not len(self._recent) else self._recent.append(
+            ids)
+        if len(self._recent) > max(1024, len(self._customers) // 8):
+            self._customers = self.customers
+            self._recent = pd.Index([])
+
+    def _append_customers(self, first_purchase):
+        # Appends new customers, doubling the buffers when they run out of room so that
+        # each customer is copied a constant number of times on average
+        n = self._n + len(first_purchase)
+        if n > len(self._first_purchase):
+            capacity = max(n, 2 * len(self._first_purchase), 1024)
+            for name in ('_first_purchase', '_last_period'):
+                old = getattr(self, name)
+                new = np.empty(capacity, dtype=old.dtype)
+                new[:self._n] = old[:self._n]
+                setattr(self, name, new)
+        self._first_purchase[self._n:n] = first_purchase
+        self._last_period[self._n:n] = np.iinfo(np.int64).min
+        self._n = n
+
+    def _grow(self, low, high):
+        # Widen the square cohort x period matrices to cover codes low..high
+        size = len(self.users)
+        if size and low >= self.origin and high < self.origin + size:
+            return
+        origin = min(low, self.origin) if size else low
+        new_size = max(high + 1, self.origin + size) - origin
+        offset = self.origin - origin
+        for name in ('users', 'revenue'):
+            old = getattr(self, name)
+            new = np.zeros((new_size, new_size), dtype=old.dtype)
+            new[offset:offset + size, offset:offset + size] = old
+            setattr(self, name, new)
+        self.origin = origin
+
+    def update(self, new_transactions):
+        """
+        Folds a batch of new transactions into the state, and returns the state.
+
+        Parameters
+        ----------
+        new_transactions: :obj: DataFrame
+            a Pandas DataFrame of new orders, with the state's datetime, customer_id and
+            order value columns.
+        -------
+        :obj: CohortState
+        """
+        batch = CustomerIndex(new_transactions, self.datetime_col,
+                              self.customerid_col, self.ordervalue_col)
+        if not len(batch):
+            return self
+        periods = batch.period_codes(self.freq)
+        values = batch.values.astype(np.float64, copy=False)
+
+        # Map the batch's customers onto the state's customer codes
+        codes = self._lookup(batch.customers)
+        known = codes >= 0
+        lowest = np.full(batch.n_customers, np.iinfo(np.int64).max)
+        np.minimum.at(lowest, batch.codes, periods)
+        if (lowest[known] < self.last_period[codes[known]]).any():
+            raise ValueError(
+                'new transactions must not fall in a period before the '
+                'latest period already folded in for the same customer')
+
+        n_new = int((~known).sum())
+        if n_new:
+            codes[~known] = np.arange(len(self), len(self) + n_new)
+            self._add_customers(batch.customers[~known])
+            self._append_customers(batch.first_purchase[~known])
+        self.first_purchase[codes[known]] = np.minimum(
+            self.first_purchase[codes[known]], batch.first_purchase[known])
+
+        cohorts = _period_codes(self.first_purchase[codes], self.freq)
+        self._grow(min(cohorts.min(), periods.min()),
+                   max(cohorts.max(), periods.max()))
+
+        # Revenue adds up directly; a user only counts once per period, so only the
+        # (customer, period) pairs after the customer's latest period are new.
+        with _stage('aggregate', len(batch)):
+            rows = cohorts[batch.codes] - self.origin
+            cols = periods - self.origin
+            np.add.at(self.revenue, (rows, cols), values)
+            pairs = np.unique(batch.codes * len(self.users) + cols)
+            pair_codes = pairs // len(self.users)
+            pair_cols = pairs % len(self.users)
+            fresh = pair_cols + self.origin > self.last_period[codes[pair_codes]]
+            np.add.at(self.users, (cohorts[pair_codes[fresh]] - self.origin,
+                                   pair_cols[fresh]), 1)
+
+        highest = np.full(batch.n_customers, np.iinfo(np.int64).min)
+        np.maximum.at(highest, batch.codes, periods)
+        self.last_period[codes] = np.maximum(self.last_period[codes], highest)
+        return self
+
+    def save(self, path):
+        """
+        Saves the state to an .npz file at path.
+        """
+        customers = self.customers
+        ids = customers.to_numpy()
+        if ids.dtype == object:
+            ids = ids.astype(str)
+        meta = {
+            'datetime_col': self.datetime_col,
+            'customerid_col': self.customerid_col,
+            'ordervalue_col': self.ordervalue_col,
+            'freq': self.freq,
+            'origin': int(self.origin)
+        }
+        np.savez(path,
+                 meta=np.array(json.dumps(meta)),
+                 customers=ids,
+                 first_purchase=self.first_purchase,
+                 last_period=self.last_period,
+                 users=self.users,
+                 revenue=self.revenue)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a state saved with CohortState.save.
+        """
+        with np.load(path, allow_pickle=False) as saved:
+            meta = json.loads(str(saved['meta']))
+            state = cls(meta['datetime_col'], meta['customerid_col'],
+                        meta['ordervalue_col'], meta['freq'])
+            state._customers = pd.Index(saved['customers'])
+            state._first_purchase = saved['first_purchase']
+            state._last_period = saved['last_period']
+            state._n = len(state._first_purchase)
+            state.users = saved['users']
+            state.revenue = saved['revenue']
+        state.origin = meta['origin']
+        return state
+
+    def user_counts(self, freq=None):
+        """
+        Returns unique users by cohort and order period, as a Series indexed by
+        (CohortGroup, OrderPeriod) period codes. Only non-empty cells are included.
+        """
+        if freq not in (None, self.freq):
+            raise ValueError(
+                'unique users can only be read at the freq the state was built '
+                'with, {!r}'.format(self.freq))
+        return _nonzero_cells(self.users, self.origin)
+
+    def revenue_matrix(self, freq=None):
+        """
+        Returns revenue by cohort (rows) and order period (columns) at freq, indexed by
+        period codes. Cells without any orders are NaN.
+        """
+        freq = self.freq if freq is None else freq
+        rows, cols = np.nonzero(self.users)
+        revenue = pd.Series(self.revenue[rows, cols])
+        if freq != self.freq:
+            if (self.freq, freq) not in _ROLLUPS:
+                raise ValueError('cannot roll {!r} periods up into {!r}'.format(
+                    self.freq, freq))
+            rows = _period_codes(_period_starts(rows + self.origin, self.freq),
+                                 freq)
+            cols = _period_codes(_period_starts(cols + self.origin, self.freq),
+                                 freq)
+        else:
+            rows = rows + self.origin
+            cols = cols + self.origin
+        return revenue.groupby([rows, cols]).sum().unstack()
+
+
+# (fine, coarse) freq pairs where every fine period lies within one coarse period
+_ROLLUPS = {('D', 'W'), ('D', 'M'), ('D', 'Q'), ('D', 'Y'), ('M', 'Q'),
+            ('M', 'Y'), ('Q', 'Y')}
+
+
+class CustomerSketch(object):
+    """
+    HyperLogLog sketches of the distinct customers in each group of orders.
+
+    A group is a period, or a (cohort, period) cell, identified by its period codes.
+    Each sketch takes 2**precision bytes and estimates its distinct count with a
+    relative standard error of about 1.04 / sqrt(2**precision), however many orders
+    went into it. Sketches built from different shards of a transaction log can be
+    unioned with merge(), and saved to and loaded from disk.
+
+    Customers are hashed from their ids with pandas.util.hash_array, so shards must
+    store customer ids with the same dtype to be merged.
+
+    Attributes
+    ----------
+    keys: :obj: ndarray
+        the period codes of each group, one row per group.
+    registers: :obj: ndarray
+        the HyperLogLog registers, one row of 2**precision bytes per group.
+    freq: string
+        the period the keys are coded in.
+    precision: int
+        the number of hash bits used to pick a register.
+    """
+
+    def __init__(self, keys, registers, freq, precision):
+        self.keys = keys
+        self.registers = registers
+        self.freq = freq
+        self.precision = precision
+
+    @staticmethod
+    def precision_for(error):
+        """
+        Returns the smallest precision whose relative standard error is at most error.
+        """
+        precision = int(np.ceil(np.log2((1.04 / error)**2)))
+        return min(max(precision, 4), 18)
+
+    @classmethod
+    def build(cls, hashes, keys, freq, precision=12):
+        """
+        Creates sketches from the uint64 customer hash and the group keys of each order.
+
+        Parameters
+        ----------
+        hashes: :obj: ndarray
+            the uint64 hash of each order's customer id.
+        keys: :obj: ndarray
+            the group of each order, as a 1-d array of period codes or a 2-d array with
+            one row of period codes per order.
+        freq: string
+            the period the keys are coded in.
+        precision: int, optional
+            the number of hash bits used to pick a register, 4 to 18.
+        -------
+        :obj: CustomerSketch
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        if keys.ndim == 1:
+            keys = keys[:, None]
+        groups, inverse = _unique_rows(keys)
+        m = 1 << precision
+        hashes = np.asarray(hashes, dtype=np.uint64)
+
+        # The top bits of a hash pick the register; the register keeps the highest rank,
+        # i.e. position of the first set bit, seen among the remaining bits.
+        register = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - precision)) - 1)
+        rank = (64 - precision) - _bit_length(rest) + 1
+
+        registers = np.zeros(len(groups) * m, dtype=np.uint8)
+        np.maximum.at(registers,
+                      inverse.reshape(-1) * m + register,
+                      rank.astype(np.uint8))
+        return cls(groups, registers.reshape(len(groups), m), freq, precision)
+
+    def merge(self, other):
+        """
+        Returns the union of two sketches, e.g. of two shards of a transaction log.
+        """
+        if (other.freq, other.precision) != (self.freq, self.precision):
+            raise ValueError(
+                'only sketches with the same freq and precision can be merged')
+        keys = np.concatenate([self.keys, other.keys])
+        groups, inverse = _unique_rows(keys)
+        registers = np.zeros((len(groups), self.registers.shape[1]),
+                             dtype=np.uint8)
+        np.maximum.at(registers, inverse.reshape(-1),
+                      np.concatenate([self.registers, other.registers]))
+        return CustomerSketch(groups, registers, self.freq, self.precision)
+
+    def cumulative(self):
+        """
+        Returns sketches of the customers seen in each period or any earlier one.
+        Only defined for sketches keyed by period alone.
+        """
+        if self.keys.shape[1] != 1:
+            raise ValueError('cumulative() needs sketches keyed by period')
+        return CustomerSketch(self.keys,
+                              np.maximum.accumulate(self.registers, axis=0),
+                              self.freq, self.precision)
+
+    def estimate(self):
+        """
+        Returns the estimated number of distinct customers in each group, as a Series
+        indexed by the group keys.
+        """
+        m = self.registers.shape[1]
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.exp2(-self.registers.astype(
+            np.float64)).sum(axis=1)
+
+        # Linear counting is more accurate while many registers are still empty
+        zeros = (self.registers == 0).sum(axis=1)
+        with np.errstate(divide='ignore'):
+            linear = m * np.log(m / np.maximum(zeros, 1))
+        estimate = np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+        if self.keys.shape[1] == 1:
+            index = pd.Index(self.keys[:, 0])
+        else:
+            index = pd.MultiIndex.from_arrays(list(self.keys.T))
+        return pd.Series(estimate, index=index)
+
+    def save(self, path):
+        """
+        Saves the sketches to an .npz file at path, or to a writable file object.
+        """
+        np.savez_compressed(path,
+                            keys=self.keys,
+                            registers=self.registers,
+                            freq=np.array(self.freq),
+                            precision=np.array(self.precision))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads sketches saved with CustomerSketch.save, from a path or file object.
+        """
+        with np.load(path, allow_pickle=False) as saved:
+            return cls(saved['keys'], saved['registers'], str(saved['freq']),
+                       int(saved['precision']))
+
+
+def _unique_rows(keys):
+    # np.unique(keys, axis=0, return_inverse=True) for int64 rows, sorting one flat
+    # code per row rather than the rows themselves.
+    if not len(keys):
+        return keys, np.zeros(0, dtype=np.int64)
+    low = keys.min(axis=0)
+    shape = keys.max(axis=0) - low + 1
+    flat = np.ravel_multi_index(tuple((keys - low).T), shape)
+    groups, inverse = np.unique(flat, return_inverse=True)
+    return np.column_stack(np.unravel_index(groups, shape)) + low, inverse
+
+
+def _bit_length(values):
+    # Bit length of uint64 values. float64 is exact below 2**53, so each 32-bit half
+    # goes through frexp on its own.
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+
+def _customer_hashes(customers):
+    return pd.util.hash_array(np.asarray(customers))
+
+
+def customer_sketch(transaction_log,
+                    datetime_col,
+                    customerid_col,
+                    by='period',
+                    freq='M',
+                    error=0.02):
+    """
+    Creates HyperLogLog sketches of the distinct customers per period or per cohort and period.
+
+    Parameters
+    ----------
+    transaction_log: :obj: DataFrame
+        a Pandas DataFrame that contains your transaction log, or a CustomerIndex built from it.
+    datetime_col: string
+        the column in transaction_log DataFrame that denotes the datetime of an order.
+    customerid_col: string
+        the column in transaction_log DataFrame that contains the unique customer_id.
+    by: string, optional
+        'period' for one sketch per order period, or 'cohort' for one per (cohort, order
+        period) cell. Cohort sketches from different shards only union correctly when
+        each shard sees every order of its customers.
+    freq: string, optional
+        the period to bucket orders by; one of 'D', 'W', 'M', 'Q' or 'Y'.
+    error: float, optional
+        the relative standard error to size the sketches for.
+    -------
+    :obj: CustomerSketch
+    """
+    if by not in ('period', 'cohort'):
+        raise ValueError("by must be 'period' or 'cohort', not {!r}".format(by))
+    precision = CustomerSketch.precision_for(error)
+    if isinstance(transaction_log, CustomerIndex):
+        index = transaction_log
+        hashes = _customer_hashes(index.customers)[index.codes]
+        keys = index.period_codes(freq)
+        if by == 'cohort':
+            keys = np.column_stack([index.cohort_codes(freq)[index.codes], keys])
+    elif by == 'cohort':
+        # Sketches need no CustomerIndex: a customer's cohort is the earliest of their
+        # order periods, and each distinct customer id is hashed once
+        with _stage('bucket', len(transaction_log)):
+            backend = _backend(transaction_log)
+            codes, customers = backend.factorize(customerid_col)
+            if (codes < 0).any():
+                raise ValueError(
+                    "'{}' contains missing customer ids".format(customerid_col))
+            periods = _period_codes(backend.datetimes(datetime_col), freq)
+        with _stage('first-purchase', len(codes)):
+            cohorts = np.full(len(customers), np.iinfo(np.int64).max)
+            np.minimum.at(cohorts, codes, periods)
+            hashes = _customer_hashes(customers)[codes]
+            keys = np.column_stack([cohorts[codes], periods])
+    else:
+        # Per-period sketches need no customer-level pass, so skip building an index
+        backend = _backend(transaction_log)
+        hashes = _customer_hashes(backend.column(customerid_col))
+        keys = _period_codes(backend.datetimes(datetime_col), freq)
+    with _stage('aggregate', len(hashes)) as stage:
+        sketch = CustomerSketch.build(hashes, keys, freq, precision)
+        stage.rows_out = len(sketch.keys)
+    return sketch
+
+
+# Batch reports. A report computes every table its charts need from one CustomerIndex,
+# so first purchases, first orders and period codes are worked out once however many
+# charts and granularities share them, then draws the charts in worker processes.
+# Each (chart, freq, segment_col) job is keyed by a digest of the input file, its
+# settings and the module's source, and jobs whose outputs are already on disk under
+# the same key are skipped.
+
+# chart: (table, whether the table can be split by segment)
+REPORT_CHARTS = collections.OrderedDict([
+    ('sales_chart', ('sales_table', True)),
+    ('cohort_retention_chart', ('cohort_retention_matrix', False)),
+    ('new_customers_chart', ('new_customers_table', True)),
+    ('customer_type_revenue_mix', ('customer_type_revenue_table', True)),
+    ('customer_type_count', ('customer_type_count_table', True)),
+    ('c3_chart', ('c3_pivot', False)),
+])
+
+
+def _file_digest(path):
+    # SHA-1 of a file's content, or of every file's name and content in a directory
+    digest = hashlib.sha1()
+    if os.path.isdir(path):
+        names = sorted(
+            os.path.relpath(os.path.join(root, name), path)
+            for root, _, files in os.walk(path) for name in files)
+    else:
+        names = [None]
+    for name in names:
+        if name is not None:
+            digest.update(name.encode())
+        with open(path if name is None else os.path.join(path, name), 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_name(*parts):
+    return re.sub(r'[^\w.=-]+', '_', '_'.join(str(part) for part in parts))
+
+
+def _report_table(table, index, frame, freq, segment_col):
+    # One of the chart tables, from the report's shared index. Segmented tables are
+    # computed for every segment at once.
+    datetime_col = index.datetime_col
+    customerid_col = index.customerid_col
+    ordervalue_col = index.ordervalue_col
+    if segment_col is not None:
+        if table == 'sales_table':
+            return _segmented_sales(frame, index, segment_col, datetime_col,
+                                    ordervalue_col, customerid_col, freq, False,
+                                    0.02)
+        if table == 'new_customers_table':
+            return _segmented_new_customers(frame, index, segment_col, freq)
+        return _segmented_buyer_types(
+            frame, index, segment_col, freq, 'type_revenue'
+            if table == 'customer_type_revenue_table' else 'type_users')
+    if table == 'c3_pivot':
+        return c3_pivot(index, customerid_col, datetime_col, ordervalue_col,
+                        freq=freq)
+    if table in ('sales_table', 'customer_type_revenue_table'):
+        return globals()[table](index,
+                                datetime_col,
+                                customerid_col,
+                                ordervalue_col,
+                                freq=freq)
+    return globals()[table](index, datetime_col, customerid_col, freq=freq)
+
+
+def _draw_report_chart(chart, table, customerid_col, ordervalue_col):
+    # Draws a chart from its table with the chart's default labels, without showing it
+    options = {
+        name: parameter.default
+        for name, parameter in inspect.signature(
+            globals()[chart]).parameters.items()
+    }
+    if chart == 'sales_chart':
+        return _draw_sales(table, customerid_col, ordervalue_col,
+                           options['customer_count'], options['title'],
+                           options['ylabel1'], options['ylabel2'], False)
+    if chart == 'cohort_retention_chart':
+        return _draw_retention(table, (), options['title'], options['ylabel'],
+                               options['max_age'], False)
+    if chart == 'new_customers_chart':
+        return _draw_new_customers(table, options['title'], options['xlabel'],
+                                   options['ylabel'], False)
+    if chart == 'customer_type_revenue_mix':
+        return _buyer_type_bars(table, options['figsize'], options['rotation'],
+                                'Percent of Monthly Revenue', False)
+    if chart == 'customer_type_count':
+        return _buyer_type_bars(table, options['figsize'], options['rotation'],
+                                'Count of Customers', False)
+    return _draw_c3(table, options['title'], False)
+
+
+def _render_report_chart(task):
+    # Runs in a worker process: draws and saves one chart, and times it
+    chart, name, table, customerid_col, ordervalue_col, directory, format = task
+    started = time.perf_counter()
+    figure = _draw_report_chart(chart, table, customerid_col, ordervalue_col)
+    path, = save_charts({name: figure}, directory, format)
+    return path, time.perf_counter() - started
+
+
+def _load_report_log(path, datetime_col, customerid_col, ordervalue_col,
+                     segments, line_items):
+    # The transaction log of a report: a TransactionLog store directory, a file of
+    # line items, or a CSV or Parquet transaction log
+    if os.path.isdir(path):
+        if segments:
+            raise ValueError('segments need a CSV or Parquet transaction log')
+        return TransactionLog.load(path)
+    if line_items is not None:
+        if segments:
+            raise ValueError('segments need a transaction log, not line items')
+        return read_transaction_log(
+            path,
+            line_items['orderid_col'],
+            datetime_col,
+            customerid_col,
+            line_items['quantity_col'],
+            line_items['unitprice_col'],
+            returns=line_items.get('returns', 'keep'),
+            cancel_prefix=line_items.get('cancel_prefix', 'C'))
+    columns = [datetime_col, customerid_col, ordervalue_col] + list(segments)
+    if str(path).lower().endswith(('.parquet', '.pq')):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def report(path,
+           output,
+           datetime_col=None,
+           customerid_col=None,
+           ordervalue_col=None,
+           charts=None,
+           freqs=('M', ),
+           segments=(),
+           line_items=None,
+           format='html',
+           n_jobs=None,
+           force=False):
+    """
+    Computes and draws a batch of charts from a transaction log file, writing every table
+    and chart to a directory.
+
+    The file is read once, and every table is computed from one CustomerIndex of it,
+    so first purchases, first orders and period codes are shared by all the charts and
+    granularities. Charts are then drawn in n_jobs worker processes. Each chart,
+    granularity and segment column makes one job, keyed by a digest of the file and of
+    the job's settings; a job whose outputs are already in output under the same key is
+    skipped, and when every job is, the file is not even read.
+
+    Parameters
+    ----------
+    path: string
+        a CSV or Parquet transaction log, a file of line items (see line_items), or a
+        TransactionLog store directory.
+    output: string
+        the directory to write to: tables/ holds each table as CSV, charts/ each chart,
+        manifest.json the key of every job written, and timings.json the timings of the
+        run.
+    datetime_col: string
+        the column that denotes the datetime of an order. Taken from the store by default.
+    customerid_col: string
+        the column that contains the unique customer_id. Taken from the store by default.
+    ordervalue_col: string
+        the column that contains the total value of an order. Taken from the store by
+        default, and 'OrderValue' for line items.
+    charts: list, optional
+        the names of the charts to draw, all of REPORT_CHARTS by default.
+    freqs: list, optional
+        the periods to draw each chart at; each of 'D', 'W', 'M', 'Q' or 'Y'.
+    segments: list, optional
+        columns assigning each order to a segment. The charts that can be split by
+        segment are also drawn once per segment of each column.
+    line_items: dict, optional
+        orderid_col, quantity_col and unitprice_col, if path holds line items rather than
+        orders, and optionally returns and cancel_prefix. They are then summed into
+        orders as by read_transaction_log, which raises on orders whose lines disagree
+        on their date or customer.
+    format: string, optional
+        the format of the charts, as in save_charts.
+    n_jobs: int, optional
+        the number of worker processes to draw charts in; -1 uses every CPU.
+    force: boolean, optional
+        recompute every job, even those whose outputs are up to date.
+    -------
+    timings: dict
+        'stages' maps each stage (fingerprint, load, the stages of profile(), write and
+        render) to its seconds; 'jobs' lists the jobs run and 'skipped' those up to date.
+    """
+    charts = list(REPORT_CHARTS) if charts is None else list(charts)
+    for chart in charts:
+        if chart not in REPORT_CHARTS:
+            raise ValueError('charts must be among {}, not {!r}'.format(
+                list(REPORT_CHARTS), chart))
+    for freq in freqs:
+        if freq not in PERIODS:
+            raise ValueError('freq must be one of {}, not {!r}'.format(
+                PERIODS, freq))
+    if line_items is not None:
+        ordervalue_col = 'OrderValue'
+    stages = collections.OrderedDict()
+
+    def add(stage, seconds):
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+    started = time.perf_counter()
+    digest = _file_digest(path)
+    add('fingerprint', time.perf_counter() - started)
+
+    # The plan: one job per chart, freq and segment column
+    jobs = []
+    for chart in charts:
+        table, segmentable = REPORT_CHARTS[chart]
+        for freq in freqs:
+            for segment_col in [None] + (list(segments) if segmentable else []):
+                name = _file_name(chart, freq, *([segment_col]
+                                                 if segment_col else []))
+                settings = [
+                    _source_digest(), digest, chart, freq, segment_col,
+                    datetime_col, customerid_col, ordervalue_col, line_items,
+                    format
+                ]
+                key = hashlib.sha1(
+                    json.dumps(settings, sort_keys=True).encode()).hexdigest()
+                jobs.append((name, chart, table, freq, segment_col, key))
+
+    manifest_path = os.path.join(output, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    pending = [
+        job for job in jobs
+        if force or job[0] not in manifest or manifest[job[0]]['key'] != job[5]
+        or not all(
+            os.path.exists(os.path.join(output, file))
+            for file in manifest[job[0]]['files'])
+    ]
+
+    tasks = []
+    if pending:
+        started = time.perf_counter()
+        log = _load_report_log(path, datetime_col, customerid_col,
+                               ordervalue_col, segments, line_items)
+        add('load', time.perf_counter() - started)
+        if isinstance(log, CustomerIndex):
+            datetime_col = datetime_col or log.datetime_col
+            customerid_col = customerid_col or log.customerid_col
+            ordervalue_col = ordervalue_col or log.ordervalue_col
+
+        tables_dir = os.path.join(output, 'tables')
+        charts_dir = os.path.join(output, 'charts')
+        os.makedirs(tables_dir, exist_ok=True)
+        with profile(lambda record: add(record['stage'], record['seconds'])):
+            index = _customer_index(log, datetime_col, customerid_col,
+                                    ordervalue_col)
+            tables = {}
+            for name, chart, table, freq, segment_col, key in pending:
+                if (table, freq, segment_col) not in tables:
+                    tables[table, freq, segment_col] = _report_table(
+                        table, index, log, freq, segment_col)
+
+        started = time.perf_counter()
+        for name, chart, table, freq, segment_col, key in pending:
+            result = tables[table, freq, segment_col]
+            result.to_csv(os.path.join(tables_dir, name + '.csv'))
+            if segment_col is None:
+                parts = [(name, result)]
+            else:
+                parts = [(_file_name(name, segment), result.loc[segment])
+                         for segment in result.index.unique(0)]
+            files = [os.path.join('tables', name + '.csv')]
+            for chart_name, part in parts:
+                tasks.append((chart, chart_name, part, customerid_col,
+                              ordervalue_col, charts_dir, format))
+                files.append(
+                    os.path.join('charts', '{}.{}'.format(chart_name, format)))
+            manifest[name] = {'key': key, 'files': files}
+        add('write', time.perf_counter() - started)
+
+        started = time.perf_counter()
+        bundle = os.path.join(charts_dir, 'plotly.min.js')
+        if format == 'html' and tasks and not os.path.exists(bundle):
+            # The plotly charts share one plotly.min.js. Written here once, it is
+            # already there for every job, instead of being written by each worker
+            # at the same time.
+            from plotly.offline import get_plotlyjs
+
+            os.makedirs(charts_dir, exist_ok=True)
+            with open(bundle, 'w', encoding='utf-8') as f:
+                f.write(get_plotlyjs())
+        n_workers = min(_n_workers(n_jobs), len(tasks))
+        if n_workers > 1:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            context = None
+            if 'fork' in multiprocessing.get_all_start_methods():
+                # Forked workers inherit the plotting libraries instead of each
+                # importing them
+                import matplotlib.figure  # noqa: F401
+                import plotly.graph_objects  # noqa: F401
+                context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(n_workers, mp_context=context) as pool:
+                list(pool.map(_render_report_chart, tasks))
+        else:
+            for task in tasks:
+                _render_report_chart(task)
+        add('render', time.perf_counter() - started)
+
+        # The manifest is only written once every output is, so an interrupted run
+        # redoes its jobs
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+
+    timings = {
+        'stages': stages,
+        'jobs': [job[0] for job in pending],
+        'skipped': [job[0] for job in jobs if job not in pending],
+        'charts': len(tasks)
+    }
+    os.makedirs(output, exist_ok=True)
+    with open(os.path.join(output, 'timings.json'), 'w') as f:
+        json.dump(timings, f, indent=1)
+    return timings
+
+
+def main(argv=None):
+    """
+    The lifestream command line. `lifestream report INPUT --config CONFIG --output DIR`
+    runs report on INPUT, with the keyword arguments in the JSON file CONFIG, and prints
+    its timings.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='lifestream')
+    commands = parser.add_subparsers(dest='command')
+    command = commands.add_parser(
+        'report', help='compute and draw a batch of charts from a transaction log')
+    command.add_argument('input',
+                         help='a CSV or Parquet file, or a TransactionLog store')
+    command.add_argument('--config',
+                         help='a JSON file of report() keyword arguments, e.g. '
+                         'datetime_col, charts, freqs and segments')
+    command.add_argument('--output', required=True, help='the output directory')
+    command.add_argument('--jobs',
+                         type=int,
+                         default=None,
+                         help='worker processes to draw charts in; -1 for every CPU')
+    command.add_argument('--format', default=None, help="e.g. 'html' or 'png'")
+    command.add_argument('--force',
+                         action='store_true',
+                         help='recompute jobs whose outputs are up to date')
+    args = parser.parse_args(argv)
+    if args.command != 'report':
+        parser.print_help()
+        return 2
+
+    options = {}
+    if args.config is not None:
+        with open(args.config) as f:
+            options = json.load(f)
+    if args.jobs is not None:
+        options['n_jobs'] = args.jobs
+    if args.format is not None:
+        options['format'] = args.format
+    timings = report(args.input, args.output, force=args.force, **options)
+
+    for stage, seconds in timings['stages'].items():
+        print('{:<16}{:>9.3f} s'.format(stage, seconds))
+    print('{} jobs run, {} charts drawn, {} jobs up to date'.format(
+        len(timings['jobs']), timings['charts'], len(timings['skipped'])))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())